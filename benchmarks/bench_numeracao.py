@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Benchmark da detecção de numerações puladas.
+
+Uso: python benchmarks/bench_numeracao.py [quantidade ...]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nfce_relatorio.numeracao import detectar_numeracoes_puladas, total_pulados  # noqa: E402
+
+
+def criar_df(quantidade, grupos=20, semente=0):
+    """
+    Notas de vários CNPJ/séries intercalados, cada grupo com numeração
+    sequencial e ~0,1% de saltos, algumas canceladas e um número fora da série
+    """
+    gerador = np.random.default_rng(semente)
+    grupo = gerador.integers(0, grupos, size=quantidade)
+    passos = gerador.choice([1, 2, 5], size=quantidade, p=[0.999, 0.0007, 0.0003])
+    numeros = pd.Series(passos).groupby(grupo).cumsum().to_numpy(copy=True)
+    numeros[-1] = 900000000
+    status = np.where(gerador.random(quantidade) < 0.01, 'CANCELADO', 'AUTORIZADO')
+    numero_texto = pd.Series(numeros).astype(str).str.zfill(9)
+    cnpj = pd.Series(grupo // 4 + 10000000000100).astype(str)
+    serie = pd.Series(grupo % 4 + 1).astype(str).str.zfill(3)
+    chave = '352401' + cnpj + '65' + serie + numero_texto + '100000001' + '0'
+    return pd.DataFrame({
+        'Chave da Nota': chave,
+        'Número NFCe': numero_texto,
+        'Status': status,
+    })
+
+
+def main(quantidades):
+    for quantidade in quantidades:
+        df = criar_df(quantidade)
+        inicio = time.perf_counter()
+        intervalos = detectar_numeracoes_puladas(df)
+        decorrido = time.perf_counter() - inicio
+        print(f"{quantidade:>10} notas: {decorrido:8.3f} s, {len(intervalos)} grupo(s) com saltos, "
+              f"{sum(map(len, intervalos.values()))} intervalo(s), {total_pulados(intervalos)} número(s) pulado(s)")
+
+
+if __name__ == '__main__':
+    main([int(q) for q in sys.argv[1:]] or [10_000, 100_000, 1_000_000, 5_000_000])
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Benchmark do fluxo completo sobre o acervo sintético (benchmarks/corpus.py):
+leitura dos XML, DataFrame, conciliação, numeração, resumo, Excel e cada PDF.
+
+Os tempos são comparados com a referência gravada em benchmarks/referencia.json;
+se alguma etapa ficar mais lenta que a referência além da tolerância, o
+script termina com código 1. Os ZIP gerados ficam em dados/corpus e são
+reaproveitados nas próximas execuções.
+
+Uso:
+  python benchmarks/bench_pipeline.py [quantidade ...] [--tolerancia 0.5]
+  python benchmarks/bench_pipeline.py 1000 100000 --gravar-referencia
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from benchmarks.corpus import gravar_corpus  # noqa: E402
+from nfce_relatorio import config  # noqa: E402
+from nfce_relatorio.conciliacao import conciliar  # noqa: E402
+from nfce_relatorio.entrada import iterar_caminhos, ler_antecipado  # noqa: E402
+from nfce_relatorio.numeracao import detectar_numeracoes_puladas  # noqa: E402
+from nfce_relatorio.pipeline import (  # noqa: E402
+    calcular_totais,
+    gerar_relatorio,
+    montar_dataframe,
+    nome_relatorio,
+    processar_xmls,
+)
+from nfce_relatorio.resumo import calcular_resumo  # noqa: E402
+
+QUANTIDADES = [1_000, 100_000, 1_000_000]
+
+ETAPAS = [
+    'leitura', 'dataframe', 'conciliacao', 'numeracao', 'resumo',
+    'excel', 'pdf', 'pdf_resumido', 'pdf_numeros_pulados',
+]
+
+# Relatório gerado em cada etapa (ver pipeline.RELATORIOS)
+RELATORIO_ETAPA = {'excel': 'excel', 'pdf': 'pdf', 'pdf_resumido': 'resumo', 'pdf_numeros_pulados': 'numeros_pulados'}
+
+REFERENCIA = os.path.join(RAIZ, 'benchmarks', 'referencia.json')
+PASTA_CORPUS = os.path.join(RAIZ, 'dados', 'corpus')
+
+# Diferenças abaixo deste tempo são ruído de medição, não regressão
+MINIMO_SEGUNDOS = 0.05
+
+
+def preparar_corpus(quantidade, pasta=PASTA_CORPUS, semente=0):
+    """ZIP do acervo sintético com quantidade documentos, gerados só na primeira vez"""
+    destino = os.path.join(pasta, f'{quantidade}_{semente}')
+    marcador = os.path.join(destino, 'completo')
+    if not os.path.exists(marcador):
+        inicio = time.perf_counter()
+        gravar_corpus(destino, quantidade, semente=semente)
+        open(marcador, 'w').close()
+        print(f"Acervo de {quantidade} documento(s) gerado em {time.perf_counter() - inicio:.1f} s")
+    return sorted(os.path.join(destino, nome) for nome in os.listdir(destino) if nome.endswith('.zip'))
+
+
+@contextmanager
+def _cronometro(tempos, etapa):
+    inicio = time.perf_counter()
+    yield
+    tempos[etapa] = round(time.perf_counter() - inicio, 4)
+
+
+def medir(quantidade, pasta_corpus=PASTA_CORPUS, semente=0, workers=None):
+    """Tempo (s) de cada etapa de ETAPAS sobre o acervo de quantidade documentos"""
+    zips = preparar_corpus(quantidade, pasta_corpus, semente)
+    tempos = {}
+    with _cronometro(tempos, 'leitura'):
+        resultado = processar_xmls(ler_antecipado(iterar_caminhos(zips)), workers=workers)
+    with _cronometro(tempos, 'dataframe'):
+        df = montar_dataframe(resultado.registros)
+    with _cronometro(tempos, 'conciliacao'):
+        df = conciliar(df).df
+    with _cronometro(tempos, 'numeracao'):
+        numeros_pulados = detectar_numeracoes_puladas(df)
+    with _cronometro(tempos, 'resumo'):
+        calcular_resumo(df, por_loja=True)
+        totais = calcular_totais(df)
+    with tempfile.TemporaryDirectory() as pasta:
+        for etapa, tipo in RELATORIO_ETAPA.items():
+            with _cronometro(tempos, etapa):
+                gerar_relatorio(tipo, df, totais, numeros_pulados, os.path.join(pasta, nome_relatorio(tipo)))
+    return tempos
+
+
+def ambiente():
+    """Descrição da máquina em que os tempos foram medidos"""
+    return {
+        'python': platform.python_version(),
+        'sistema': platform.platform(),
+        'cpus': os.cpu_count(),
+        'workers': config.WORKERS,
+    }
+
+
+def ler_referencia(caminho=REFERENCIA):
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+
+def gravar_referencia(tempos, caminho=REFERENCIA):
+    """Grava os tempos medidos ({quantidade: {etapa: s}}) como a nova referência, mantendo as demais quantidades"""
+    referencia = ler_referencia(caminho) or {'tempos': {}}
+    referencia['ambiente'] = ambiente()
+    referencia['tempos'].update({str(quantidade): etapas for quantidade, etapas in tempos.items()})
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(referencia, arquivo, indent=2, sort_keys=True)
+        arquivo.write('\n')
+
+
+def comparar(tempos, referencia, tolerancia=0.5, minimo=MINIMO_SEGUNDOS):
+    """
+    Regressões dos tempos medidos ({quantidade: {etapa: s}}) em relação à
+    referência: etapas mais lentas que referência * (1 + tolerancia) e por
+    mais de minimo segundos. Retorna [(quantidade, etapa, referência, atual)];
+    quantidades e etapas sem referência são ignoradas.
+    """
+    regressoes = []
+    for quantidade, etapas in tempos.items():
+        anteriores = referencia.get('tempos', {}).get(str(quantidade), {})
+        for etapa, atual in etapas.items():
+            anterior = anteriores.get(etapa)
+            if anterior is None:
+                continue
+            if atual > anterior * (1 + tolerancia) and atual - anterior > minimo:
+                regressoes.append((quantidade, etapa, anterior, atual))
+    return regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mede cada etapa do processamento sobre o acervo sintético.')
+    parser.add_argument('quantidades', nargs='*', type=int, default=QUANTIDADES,
+                        help='tamanhos do acervo em documentos (padrão: 1000 100000 1000000)')
+    parser.add_argument('--tolerancia', type=float, default=0.5,
+                        help='aumento relativo aceito em relação à referência (padrão: 0.5 = 50%%)')
+    parser.add_argument('--gravar-referencia', action='store_true', help='grava os tempos medidos como referência')
+    parser.add_argument('--referencia', default=REFERENCIA, help='arquivo JSON da referência')
+    parser.add_argument('--corpus', default=PASTA_CORPUS, help='pasta dos ZIP do acervo sintético')
+    parser.add_argument('--workers', type=int, default=None, help='processos de leitura (padrão: NFCE_WORKERS)')
+    args = parser.parse_args(argv)
+
+    referencia = ler_referencia(args.referencia)
+    if referencia and referencia.get('ambiente', {}).get('cpus') != os.cpu_count():
+        print(f"Aviso: a referência foi medida em outra máquina ({referencia['ambiente']})")
+
+    tempos = {}
+    for quantidade in args.quantidades:
+        tempos[quantidade] = medir(quantidade, args.corpus, workers=args.workers)
+        anteriores = (referencia or {}).get('tempos', {}).get(str(quantidade), {})
+        print(f"{quantidade:>10} documentos")
+        for etapa, segundos in tempos[quantidade].items():
+            anterior = anteriores.get(etapa)
+            comparacao = f"  (referência {anterior:.3f} s)" if anterior is not None else ''
+            print(f"  {etapa:<20} {segundos:9.3f} s{comparacao}")
+
+    if args.gravar_referencia:
+        gravar_referencia(tempos, args.referencia)
+        print(f"Referência gravada em {args.referencia}")
+        return 0
+    if referencia is None:
+        print("Sem referência para comparar (use --gravar-referencia).")
+        return 0
+    regressoes = comparar(tempos, referencia, args.tolerancia)
+    for quantidade, etapa, anterior, atual in regressoes:
+        print(f"REGRESSÃO: {etapa} com {quantidade} documentos: {atual:.3f} s (referência {anterior:.3f} s)")
+    return 1 if regressoes else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
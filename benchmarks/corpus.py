@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Gerador de um acervo sintético de XML de NFCe, para os benchmarks.
+
+Gera todos os formatos lidos pelo parser (nfeProc com vários itens,
+procEventoNFe, envEvento, procInutNFe, inutNFe e enviNFe), com e sem
+namespace, além de arquivos corrompidos, em arquivos ZIP de tamanho
+configurável. As chaves de acesso são coerentes (CNPJ, série, numeração
+sequencial com alguns saltos e dígito verificador), os cancelamentos
+apontam para notas já emitidas e as inutilizações cobrem faixas puladas.
+
+Uso: python benchmarks/corpus.py PASTA [--quantidade N] [--por-zip N] [--semente N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import zipfile
+from datetime import datetime, timedelta
+
+# Proporção de cada formato no acervo
+PROPORCOES = {
+    'nfeProc': 0.90,
+    'procEventoNFe': 0.03,
+    'envEvento': 0.005,
+    'procInutNFe': 0.01,
+    'inutNFe': 0.005,
+    'enviNFe': 0.01,
+    'corrompido': 0.04,
+}
+
+# Variação do namespace dos documentos: padrão, sem namespace e raiz com prefixo
+NAMESPACES = {'padrao': 0.8, 'sem': 0.1, 'prefixo': 0.1}
+
+NS = 'http://www.portalfiscal.inf.br/nfe'
+
+PRODUTOS = ['Arroz 5kg', 'Feijão 1kg', 'Café 500g', 'Açúcar 1kg', 'Leite 1L', 'Pão francês', 'Óleo 900ml',
+            'Macarrão 500g', 'Sabão em pó', 'Detergente', 'Água mineral', 'Refrigerante 2L']
+
+CLIENTES = ['Maria Silva', 'João Souza', 'Ana Oliveira', 'Carlos Pereira', 'Fernanda Lima', 'José Santos']
+
+
+def digito_verificador(chave43):
+    """Dígito verificador (módulo 11) dos 43 primeiros dígitos da chave de acesso"""
+    soma = 0
+    peso = 2
+    for digito in reversed(chave43):
+        soma += int(digito) * peso
+        peso = 2 if peso == 9 else peso + 1
+    resto = soma % 11
+    return '0' if resto < 2 else str(11 - resto)
+
+
+def montar_chave(data, cnpj, serie, numero, codigo):
+    chave43 = f'35{data:%y%m}{cnpj}65{serie:03d}{numero:09d}1{codigo:08d}'
+    return chave43 + digito_verificador(chave43)
+
+
+def _data_iso(data):
+    return data.strftime('%Y-%m-%dT%H:%M:%S') + '-03:00'
+
+
+def _raiz(nome, namespace, atributos='versao="4.00"'):
+    # Abertura e fechamento do elemento raiz na variação de namespace escolhida
+    if namespace == 'sem':
+        return f'<{nome} {atributos}>', f'</{nome}>'
+    if namespace == 'prefixo':
+        return f'<nfe:{nome} xmlns:nfe="{NS}" {atributos}>', f'</nfe:{nome}>'
+    return f'<{nome} xmlns="{NS}" {atributos}>', f'</{nome}>'
+
+
+def _inf_nfe(gerador, chave, numero, serie, data, cnpj, itens):
+    produtos = []
+    total = 0.0
+    for item in range(1, itens + 1):
+        valor = round(gerador.uniform(1, 80), 2)
+        total += valor
+        produtos.append(
+            f'<det nItem="{item}"><prod><cProd>{item}</cProd><xProd>{gerador.choice(PRODUTOS)}</xProd>'
+            f'<qCom>1.0000</qCom><vProd>{valor:.2f}</vProd></prod>'
+            f'<imposto><ICMS><ICMSSN102><orig>0</orig><CSOSN>102</CSOSN></ICMSSN102></ICMS></imposto></det>'
+        )
+    if gerador.random() < 0.3:
+        destinatario = (f'<dest><CPF>{gerador.randrange(10**10, 10**11):011d}</CPF>'
+                        f'<xNome>{gerador.choice(CLIENTES)}</xNome></dest>')
+    else:
+        destinatario = ''
+    return (
+        f'<infNFe Id="NFe{chave}" versao="4.00">'
+        f'<ide><cUF>35</cUF><mod>65</mod><serie>{serie}</serie><nNF>{numero}</nNF>'
+        f'<dhEmi>{_data_iso(data)}</dhEmi><tpEmis>1</tpEmis></ide>'
+        f'<emit><CNPJ>{cnpj}</CNPJ><xNome>Loja {cnpj[:4]}</xNome></emit>'
+        f'{destinatario}{"".join(produtos)}'
+        f'<total><ICMSTot><vProd>{total:.2f}</vProd><vNF>{total:.2f}</vNF></ICMSTot></total>'
+        f'<pag><detPag><tPag>01</tPag><vPag>{total:.2f}</vPag></detPag></pag>'
+        f'</infNFe>'
+    )
+
+
+class _Emitente:
+    """Numeração de um CNPJ/série e as últimas notas emitidas (candidatas a cancelamento)"""
+
+    def __init__(self, cnpj, serie):
+        self.cnpj = cnpj
+        self.serie = serie
+        self.proximo = 1
+        self.recentes = []
+
+    def numero(self):
+        numero = self.proximo
+        self.proximo += 1
+        return numero
+
+
+class GeradorCorpus:
+    """
+    Gera os documentos do acervo sintético em sequência, com datas crescentes
+    entre inicio e inicio + dias. A mesma semente produz o mesmo acervo.
+    """
+
+    def __init__(self, quantidade, semente=0, emitentes=8, max_itens=20, inicio=datetime(2024, 1, 1), dias=365):
+        self.gerador = random.Random(semente)
+        self.quantidade = quantidade
+        self.max_itens = max_itens
+        self.inicio = inicio
+        self.passo = timedelta(days=dias) / max(quantidade, 1)
+        self.emitentes = [
+            _Emitente(f'{10_000_000 + indice:08d}000199', 1 + indice % 3) for indice in range(emitentes)
+        ]
+        self.formatos = list(PROPORCOES)
+        self.pesos = list(PROPORCOES.values())
+
+    def _data(self, posicao):
+        return self.inicio + self.passo * posicao
+
+    def _namespace(self):
+        return self.gerador.choices(list(NAMESPACES), weights=list(NAMESPACES.values()))[0]
+
+    def documentos(self):
+        """Gera (conteudo_xml em bytes, nome_do_arquivo) para cada documento"""
+        for posicao in range(self.quantidade):
+            formato = self.gerador.choices(self.formatos, weights=self.pesos)[0]
+            emitente = self.gerador.choice(self.emitentes)
+            data = self._data(posicao)
+            xml = getattr(self, '_' + formato)(emitente, data)
+            if xml is None:
+                # Ainda não há nota para cancelar: emite uma nota normal
+                formato = 'nfeProc'
+                xml = self._nfeProc(emitente, data)
+            yield xml.encode('utf-8'), f'{formato}_{posicao:08d}.xml'
+
+    def _nova_chave(self, emitente, data):
+        numero = emitente.numero()
+        # Um salto ocasional na numeração, para a verificação de numeração
+        if self.gerador.random() < 0.001:
+            numero += self.gerador.randint(1, 3)
+            emitente.proximo = numero + 1
+        chave = montar_chave(data, emitente.cnpj, emitente.serie, numero, self.gerador.randrange(10**8))
+        return chave, numero
+
+    def _nfeProc(self, emitente, data):
+        chave, numero = self._nova_chave(emitente, data)
+        emitente.recentes.append(chave)
+        if len(emitente.recentes) > 50:
+            del emitente.recentes[0]
+        itens = self.gerador.randint(1, self.max_itens)
+        abertura, fechamento = _raiz('nfeProc', self._namespace())
+        protocolo = f'1352{self.gerador.randrange(10**11):011d}'
+        return (
+            f'<?xml version="1.0" encoding="UTF-8"?>{abertura}'
+            f'<NFe xmlns="{NS}">{_inf_nfe(self.gerador, chave, numero, emitente.serie, data, emitente.cnpj, itens)}</NFe>'
+            f'<protNFe versao="4.00"><infProt><tpAmb>1</tpAmb><chNFe>{chave}</chNFe>'
+            f'<dhRecbto>{_data_iso(data + timedelta(seconds=2))}</dhRecbto><nProt>{protocolo}</nProt>'
+            f'<cStat>100</cStat><xMotivo>Autorizado o uso da NF-e</xMotivo></infProt></protNFe>'
+            f'{fechamento}'
+        )
+
+    def _evento(self, chave, data, tipo='110111'):
+        return (
+            f'<evento versao="1.00"><infEvento Id="ID{tipo}{chave}01"><cOrgao>35</cOrgao><tpAmb>1</tpAmb>'
+            f'<chNFe>{chave}</chNFe><dhEvento>{_data_iso(data)}</dhEvento><tpEvento>{tipo}</tpEvento>'
+            f'<nSeqEvento>1</nSeqEvento><detEvento versao="1.00"><descEvento>Cancelamento</descEvento>'
+            f'<nProt>1352{self.gerador.randrange(10**11):011d}</nProt><xJust>Erro no pedido do cliente</xJust>'
+            f'</detEvento></infEvento></evento>'
+        )
+
+    def _procEventoNFe(self, emitente, data):
+        if not emitente.recentes:
+            return None
+        chave = emitente.recentes.pop(self.gerador.randrange(len(emitente.recentes)))
+        abertura, fechamento = _raiz('procEventoNFe', self._namespace(), 'versao="1.00"')
+        return (
+            f'<?xml version="1.0" encoding="UTF-8"?>{abertura}{self._evento(chave, data)}'
+            f'<retEvento versao="1.00"><infEvento><cStat>135</cStat>'
+            f'<nProt>1352{self.gerador.randrange(10**11):011d}</nProt></infEvento></retEvento>{fechamento}'
+        )
+
+    def _envEvento(self, emitente, data):
+        if not emitente.recentes:
+            return None
+        chave = emitente.recentes.pop(self.gerador.randrange(len(emitente.recentes)))
+        abertura, fechamento = _raiz('envEvento', self._namespace(), 'versao="1.00"')
+        # Um evento de outro tipo (carta de correção) no mesmo envelope é ignorado
+        return (
+            f'<?xml version="1.0" encoding="UTF-8"?>{abertura}<idLote>{self.gerador.randrange(10**6)}</idLote>'
+            f'{self._evento(chave, data)}{self._evento(chave, data, "110110")}{fechamento}'
+        )
+
+    def _faixa_inutilizada(self, emitente):
+        inicio = emitente.proximo
+        fim = inicio + self.gerador.randint(0, 4)
+        emitente.proximo = fim + 1
+        return inicio, fim
+
+    def _inf_inut(self, emitente, data, inicio, fim):
+        identificador = f'ID35{data:%y}{emitente.cnpj}65{emitente.serie:03d}{inicio:09d}{fim:09d}'
+        return (
+            f'<infInut Id="{identificador}"><tpAmb>1</tpAmb><xServ>INUTILIZAR</xServ><cUF>35</cUF>'
+            f'<ano>{data:%y}</ano><CNPJ>{emitente.cnpj}</CNPJ><mod>65</mod><serie>{emitente.serie}</serie>'
+            f'<nNFIni>{inicio}</nNFIni><nNFFin>{fim}</nNFFin><xJust>Falha no sistema do caixa</xJust></infInut>'
+        )
+
+    def _procInutNFe(self, emitente, data):
+        inicio, fim = self._faixa_inutilizada(emitente)
+        abertura, fechamento = _raiz('ProcInutNFe', self._namespace())
+        return (
+            f'<?xml version="1.0" encoding="UTF-8"?>{abertura}'
+            f'<inutNFe versao="4.00">{self._inf_inut(emitente, data, inicio, fim)}</inutNFe>'
+            f'<retInutNFe versao="4.00"><infInut><cStat>102</cStat>'
+            f'<xMotivo>Inutilizacao de numero homologado</xMotivo><dhRecbto>{_data_iso(data)}</dhRecbto>'
+            f'<nProt>1352{self.gerador.randrange(10**11):011d}</nProt></infInut></retInutNFe>{fechamento}'
+        )
+
+    def _inutNFe(self, emitente, data):
+        inicio, fim = self._faixa_inutilizada(emitente)
+        abertura, fechamento = _raiz('inutNFe', self._namespace())
+        return f'<?xml version="1.0" encoding="UTF-8"?>{abertura}{self._inf_inut(emitente, data, inicio, fim)}{fechamento}'
+
+    def _enviNFe(self, emitente, data):
+        # Lote enviado sem o protocolo de retorno, com uma a três notas
+        notas = []
+        for _ in range(self.gerador.randint(1, 3)):
+            chave, numero = self._nova_chave(emitente, data)
+            itens = self.gerador.randint(1, self.max_itens)
+            notas.append(f'<NFe>{_inf_nfe(self.gerador, chave, numero, emitente.serie, data, emitente.cnpj, itens)}</NFe>')
+        abertura, fechamento = _raiz('enviNFe', self._namespace())
+        return (
+            f'<?xml version="1.0" encoding="UTF-8"?>{abertura}<idLote>{self.gerador.randrange(10**6)}</idLote>'
+            f'<indSinc>1</indSinc>{"".join(notas)}{fechamento}'
+        )
+
+    def _corrompido(self, emitente, data):
+        tipo = self.gerador.randrange(3)
+        if tipo == 0:
+            # Transferência interrompida no meio do arquivo
+            xml = self._nfeProc(emitente, data)
+            return xml[:self.gerador.randrange(20, len(xml) - 20)]
+        if tipo == 1:
+            # XML válido que não é um documento fiscal
+            return '<?xml version="1.0" encoding="UTF-8"?><pedido><numero>1</numero></pedido>'
+        return 'isto não é um XML'
+
+
+def gravar_corpus(pasta, quantidade, por_zip=10_000, semente=0, **opcoes):
+    """
+    Grava o acervo sintético (ver GeradorCorpus) em arquivos ZIP de até
+    por_zip documentos em pasta. Retorna a lista dos ZIP gravados.
+    """
+    os.makedirs(pasta, exist_ok=True)
+    gerador = GeradorCorpus(quantidade, semente, **opcoes)
+    caminhos = []
+    arquivo_zip = None
+    try:
+        for posicao, (conteudo, nome) in enumerate(gerador.documentos()):
+            if posicao % por_zip == 0:
+                if arquivo_zip is not None:
+                    arquivo_zip.close()
+                caminhos.append(os.path.join(pasta, f'lote_{len(caminhos) + 1:05d}.zip'))
+                arquivo_zip = zipfile.ZipFile(caminhos[-1], 'w', zipfile.ZIP_DEFLATED)
+            arquivo_zip.writestr(nome, conteudo)
+    finally:
+        if arquivo_zip is not None:
+            arquivo_zip.close()
+    return caminhos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Gera um acervo sintético de XML de NFCe em arquivos ZIP.')
+    parser.add_argument('pasta', help='pasta de destino dos ZIP')
+    parser.add_argument('--quantidade', type=int, default=10_000, help='número de documentos (padrão: 10000)')
+    parser.add_argument('--por-zip', type=int, default=10_000, help='documentos por ZIP (padrão: 10000)')
+    parser.add_argument('--semente', type=int, default=0, help='semente do gerador (padrão: 0)')
+    parser.add_argument('--max-itens', type=int, default=20, help='máximo de itens por nota (padrão: 20)')
+    args = parser.parse_args(argv)
+    caminhos = gravar_corpus(args.pasta, args.quantidade, args.por_zip, args.semente, max_itens=args.max_itens)
+    print(f"{args.quantidade} documento(s) gravado(s) em {len(caminhos)} ZIP em {args.pasta}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+Processamento de XML de NFCe e geração de relatórios.
+
+O mesmo mecanismo é usado pela interface Streamlit (app/app.py) e pela linha
+de comando (python -m nfce_relatorio).
+"""
+
+from .acervo import SEM_CNPJ, gravar_acervo, ler_acervo, particoes_acervo
+from .cache import CacheRegistros, abrir_cache, hash_conteudo
+from .chave import CAMPOS_CHAVE, decodificar_chaves, formatar_cnpj
+from .colunas import ColunasRegistros
+from .conciliacao import ResultadoConciliacao, conciliar
+from .datas import FUSO, converter_datas, sem_fuso
+from .desempenho import Desempenho, etapa
+from .entrada import (
+    ArquivoEmDisco,
+    ZipInseguroError,
+    contar_caminhos,
+    contar_xmls,
+    iterar_arquivos,
+    iterar_caminhos,
+    iterar_zip,
+    ler_antecipado,
+)
+from .excel import gerar_excel
+from .livro import LivroNotas, abrir_livro
+from .numeracao import (
+    agrupar_em_intervalos,
+    descrever_grupo,
+    detectar_numeracoes_puladas,
+    formatar_intervalos,
+    intervalos_pulados,
+    total_pulados,
+)
+from .parser import VERSAO_PARSER, NFCeInvalidaError, analisar_xml, extrair_registros, process_xml_file
+from .pipeline import (
+    RELATORIOS,
+    ResultadoProcessamento,
+    atualizar_livro,
+    calcular_totais,
+    carregar_acervo,
+    carregar_livro,
+    executar,
+    executar_acervo,
+    executar_livro,
+    gerar_relatorio,
+    gerar_relatorio_bytes,
+    gerar_relatorios,
+    montar_dataframe,
+    nome_relatorio,
+    processar_xmls,
+    tipos_relatorio,
+)
+from .relatorios import generate_pdf, generate_pdf_numeros_pulados, generate_pdf_resumido, normalize_str
+from .resumo import COLUNAS_RESUMO, PERIODOS, calcular_resumo, tabela_resumo, totais_resumo
+from .servidor import ServidorNFCe, criar_servidor, processar_lote, resumir_lote
+from .situacao import (
+    AUTORIZADA,
+    CANCELADA,
+    DENEGADA,
+    INUTILIZADA,
+    PRIORIDADE_SITUACAO,
+    SEM_PROTOCOLO,
+    SITUACOES,
+    STATUS_NOTA_CANCELADA,
+    mascaras,
+    situacao_por_cstat,
+)
+from .tarefas import CONCLUIDA, EXECUTANDO, FALHOU, NA_FILA, FilaTarefas, Tarefa
@@ -0,0 +1,167 @@
+import contextlib
+import os
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+
+from .chave import decodificar_chaves
+from .datas import horario_local
+from .situacao import como_categoria
+
+# Diretórios de partição do acervo: cnpj=.../ano=.../mes=...
+PARTICOES = ['cnpj', 'ano', 'mes']
+
+# Partição das notas sem chave de acesso (inutilizações) e das notas sem data
+SEM_CNPJ = 'sem_cnpj'
+SEM_DATA = 0
+
+# Arquivo de dados de cada partição
+ARQUIVO_PARTICAO = 'notas.parquet'
+
+# Arquivo de trava de cada partição (a leitura ignora arquivos iniciados por ponto)
+ARQUIVO_TRAVA = '.trava'
+
+# Colunas que identificam um documento: o mesmo documento gravado de novo
+# substitui o anterior
+COLUNAS_IDENTIFICACAO = ['Chave da Nota', 'Situação', 'Protocolo']
+
+
+def _exigir_pyarrow():
+    if pa is None:
+        raise ImportError("O acervo Parquet precisa do pacote pyarrow (pip install pyarrow)")
+
+
+def _esquema_particoes():
+    return ds.partitioning(
+        pa.schema([('cnpj', pa.string()), ('ano', pa.int32()), ('mes', pa.int32())]), flavor='hive'
+    )
+
+
+def _particoes(df):
+    """cnpj, ano e mês de cada linha de df: CNPJ do emitente pela chave e mês pelo horário de São Paulo"""
+    cnpjs = decodificar_chaves(df['Chave da Nota'])['CNPJ'].fillna(SEM_CNPJ).astype(str)
+    datas = horario_local(pd.Series(pd.to_datetime(df['Data Emissão'], errors='coerce'), index=df.index))
+    return pd.DataFrame({
+        'cnpj': cnpjs,
+        'ano': datas.dt.year.fillna(SEM_DATA).astype(np.int32),
+        'mes': datas.dt.month.fillna(SEM_DATA).astype(np.int32),
+    }, index=df.index)
+
+
+def _restaurar_tipos(df):
+    if 'Situação' in df.columns:
+        df['Situação'] = como_categoria(df['Situação'])
+    return df
+
+
+@contextlib.contextmanager
+def _travar(caminho):
+    """Trava exclusiva do arquivo caminho, entre threads e processos, enquanto o bloco executa"""
+    with open(caminho, 'a+b') as arquivo:
+        if fcntl is not None:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX)
+        else:
+            arquivo.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(arquivo.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK desiste depois de 10 segundos
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+            else:
+                arquivo.seek(0)
+                msvcrt.locking(arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def gravar_acervo(df, pasta):
+    """
+    Grava df no acervo Parquet em pasta, particionado por CNPJ do emitente,
+    ano e mês. Cada partição atingida é relida e regravada com as notas novas,
+    sem repetir documentos (COLUNAS_IDENTIFICACAO; a versão nova prevalece).
+    A troca do arquivo é atômica e cada partição fica travada (ARQUIVO_TRAVA)
+    da leitura à troca, para que gravações simultâneas não percam notas uma
+    da outra. Retorna o número de partições gravadas.
+    """
+    _exigir_pyarrow()
+    if df.empty:
+        return 0
+    grupos = _particoes(df).groupby(PARTICOES).indices
+    for (cnpj, ano, mes), posicoes in grupos.items():
+        destino = os.path.join(pasta, f'cnpj={cnpj}', f'ano={ano}', f'mes={mes}')
+        os.makedirs(destino, exist_ok=True)
+        arquivo = os.path.join(destino, ARQUIVO_PARTICAO)
+        notas = df.iloc[posicoes]
+        with _travar(os.path.join(destino, ARQUIVO_TRAVA)):
+            if os.path.exists(arquivo):
+                existentes = _restaurar_tipos(pd.read_parquet(arquivo))
+                notas = pd.concat([existentes, notas], ignore_index=True)
+                notas = notas.drop_duplicates(subset=COLUNAS_IDENTIFICACAO, keep='last')
+            temporario = os.path.join(destino, f'.{uuid.uuid4().hex}.tmp')
+            notas.to_parquet(temporario, index=False)
+            os.replace(temporario, arquivo)
+    return len(grupos)
+
+
+def _filtro_periodo(inicio, fim):
+    # Comparação de (ano, mes) com os limites, só com as colunas de partição
+    filtro = None
+    if inicio is not None:
+        inicio = pd.Period(inicio, 'M')
+        filtro = (ds.field('ano') > inicio.year) | ((ds.field('ano') == inicio.year) & (ds.field('mes') >= inicio.month))
+    if fim is not None:
+        fim = pd.Period(fim, 'M')
+        ate_fim = (ds.field('ano') < fim.year) | ((ds.field('ano') == fim.year) & (ds.field('mes') <= fim.month))
+        # Notas sem data (ano 0) só entram quando o período não é limitado
+        ate_fim = ate_fim & (ds.field('ano') != SEM_DATA)
+        filtro = ate_fim if filtro is None else filtro & ate_fim
+    return filtro
+
+
+def ler_acervo(pasta, inicio=None, fim=None, cnpjs=None, colunas=None):
+    """
+    Lê do acervo as notas dos meses de inicio a fim ('AAAA-MM', inclusive) e
+    dos CNPJs indicados (todos, se None). Só as partições e as colunas pedidas
+    são lidas do disco. O DataFrame não é ordenado; use
+    pipeline.carregar_acervo para obtê-lo como em montar_dataframe.
+    """
+    _exigir_pyarrow()
+    if not os.path.isdir(pasta):
+        raise FileNotFoundError(f"Acervo não encontrado: {pasta}")
+    dataset = ds.dataset(pasta, format='parquet', partitioning=_esquema_particoes(), exclude_invalid_files=True)
+    filtro = _filtro_periodo(inicio, fim)
+    if cnpjs:
+        filtro_cnpj = ds.field('cnpj').isin([str(cnpj) for cnpj in cnpjs])
+        filtro = filtro_cnpj if filtro is None else filtro & filtro_cnpj
+    if colunas is None:
+        colunas = [nome for nome in dataset.schema.names if nome not in PARTICOES]
+    tabela = dataset.to_table(columns=list(colunas), filter=filtro)
+    return _restaurar_tipos(tabela.to_pandas())
+
+
+def particoes_acervo(pasta):
+    """DataFrame (cnpj, ano, mes) com as partições existentes no acervo, ordenado; vazio se não houver acervo"""
+    if pa is None or not os.path.isdir(pasta):
+        return pd.DataFrame(columns=PARTICOES)
+    dataset = ds.dataset(pasta, format='parquet', partitioning=_esquema_particoes(), exclude_invalid_files=True)
+    linhas = [ds.get_partition_keys(fragmento.partition_expression) for fragmento in dataset.get_fragments()]
+    particoes = pd.DataFrame(linhas, columns=PARTICOES)
+    return particoes.drop_duplicates().sort_values(PARTICOES, ignore_index=True)
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from . import config
+from .parser import VERSAO_PARSER
+
+
+def _codificar(valor):
+    if isinstance(valor, datetime):
+        return {'$datetime': valor.isoformat()}
+    raise TypeError(f"Tipo não suportado no cache: {type(valor).__name__}")
+
+
+def _decodificar(objeto):
+    if '$datetime' in objeto:
+        return datetime.fromisoformat(objeto['$datetime'])
+    return objeto
+
+
+def hash_conteudo(xml_content):
+    """SHA-256 dos bytes do XML, usado como chave do cache"""
+    if isinstance(xml_content, str):
+        xml_content = xml_content.encode('utf-8')
+    return hashlib.sha256(xml_content).hexdigest()
+
+
+class CacheRegistros:
+    """
+    Cache persistente (SQLite) dos registros extraídos de cada XML, indexado
+    pelo SHA-256 do conteúdo. Entradas de outra VERSAO_PARSER são ignoradas e,
+    quando o arquivo passa de limite_bytes, as menos usadas recentemente são
+    removidas.
+    """
+
+    # Gravações acumuladas antes de cada commit
+    LOTE_GRAVACAO = 500
+
+    def __init__(self, caminho, limite_bytes=512 * 1024 * 1024):
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self.caminho = caminho
+        self.limite_bytes = limite_bytes
+        self.acertos = 0
+        self.falhas = 0
+        self._pendentes = 0
+        self._acessados = []
+        self._conexao = sqlite3.connect(caminho, timeout=30)
+        self._conexao.execute('PRAGMA journal_mode=WAL')
+        self._conexao.execute('PRAGMA synchronous=NORMAL')
+        self._conexao.execute(
+            'CREATE TABLE IF NOT EXISTS registros ('
+            ' sha256 TEXT PRIMARY KEY,'
+            ' versao TEXT NOT NULL,'
+            ' dados TEXT NOT NULL,'
+            ' tamanho INTEGER NOT NULL,'
+            ' acesso REAL NOT NULL)'
+        )
+        self._conexao.execute('CREATE INDEX IF NOT EXISTS idx_registros_acesso ON registros (acesso)')
+        # Registros de versões anteriores do parser não serão mais usados
+        self._conexao.execute('DELETE FROM registros WHERE versao != ?', (VERSAO_PARSER,))
+        self._conexao.commit()
+        self._total_bytes = self._conexao.execute('SELECT COALESCE(SUM(tamanho), 0) FROM registros').fetchone()[0]
+
+    def buscar(self, sha256):
+        """Retorna os registros guardados para o hash, ou None"""
+        linha = self._conexao.execute(
+            'SELECT dados FROM registros WHERE sha256 = ? AND versao = ?', (sha256, VERSAO_PARSER)
+        ).fetchone()
+        if linha is None:
+            self.falhas += 1
+            return None
+        self.acertos += 1
+        self._acessados.append(sha256)
+        return json.loads(linha[0], object_hook=_decodificar)
+
+    def guardar(self, sha256, registros):
+        dados = json.dumps(registros, default=_codificar, ensure_ascii=False)
+        self._conexao.execute(
+            'INSERT OR REPLACE INTO registros (sha256, versao, dados, tamanho, acesso) VALUES (?, ?, ?, ?, ?)',
+            (sha256, VERSAO_PARSER, dados, len(dados), time.time())
+        )
+        self._total_bytes += len(dados)
+        self._pendentes += 1
+        if self._pendentes >= self.LOTE_GRAVACAO:
+            self.gravar()
+
+    def gravar(self):
+        """Confirma as gravações pendentes e aplica o limite de tamanho"""
+        if self._acessados:
+            agora = time.time()
+            self._conexao.executemany(
+                'UPDATE registros SET acesso = ? WHERE sha256 = ?', [(agora, sha) for sha in self._acessados]
+            )
+            self._acessados = []
+        self._pendentes = 0
+        self._conexao.commit()
+        self._aplicar_limite()
+
+    def _aplicar_limite(self):
+        if self._total_bytes <= self.limite_bytes:
+            return
+        # O total acumulado é aproximado (substituições somam de novo); recalcula antes de remover
+        self._total_bytes = self._conexao.execute('SELECT COALESCE(SUM(tamanho), 0) FROM registros').fetchone()[0]
+        if self._total_bytes <= self.limite_bytes:
+            return
+        # Remove as entradas acessadas há mais tempo até ficar em 90% do limite
+        excedente = self._total_bytes - int(self.limite_bytes * 0.9)
+        removidos = 0
+        cursor = self._conexao.execute('SELECT sha256, tamanho FROM registros ORDER BY acesso')
+        remover = []
+        for sha256, tamanho in cursor:
+            if removidos >= excedente:
+                break
+            remover.append((sha256,))
+            removidos += tamanho
+        cursor.close()
+        self._conexao.executemany('DELETE FROM registros WHERE sha256 = ?', remover)
+        self._conexao.commit()
+        self._total_bytes -= removidos
+
+    def fechar(self):
+        self.gravar()
+        self._conexao.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def resumo(self):
+        return f"Cache: {self.acertos} arquivo(s) reaproveitado(s), {self.falhas} lido(s)"
+
+
+def abrir_cache(caminho=None, limite_bytes=None):
+    """Abre o cache configurado (NFCE_CACHE / NFCE_CACHE_MB); retorna None se estiver desativado"""
+    caminho = config.CACHE_PATH if caminho is None else caminho
+    if not caminho:
+        return None
+    if limite_bytes is None:
+        limite_bytes = config.CACHE_LIMITE_MB * 1024 * 1024
+    return CacheRegistros(caminho, limite_bytes)
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+# Campos da chave de acesso (44 dígitos): nome -> (início, fim)
+CAMPOS_CHAVE = {
+    'cUF': (0, 2),
+    'AAMM': (2, 6),
+    'CNPJ': (6, 20),
+    'mod': (20, 22),
+    'serie': (22, 25),
+    'nNF': (25, 34),
+    'tpEmis': (34, 35),
+    'cNF': (35, 43),
+    'cDV': (43, 44),
+}
+
+# Trechos de até 18 dígitos (cabem em int64) que, comparados em sequência,
+# reproduzem a ordem numérica da chave inteira
+TRECHOS_ORDENACAO = [(0, 18), (18, 36), (36, 44)]
+
+
+def _digitos(chaves):
+    """Chaves normalizadas, máscara das válidas (44 dígitos) e matriz (n, 44) com os dígitos das válidas"""
+    chaves = pd.Series(chaves).astype(str).str.strip()
+    validas = chaves.str.fullmatch(r'\d{44}').to_numpy(dtype=bool)
+    # Dígitos das chaves válidas como uma matriz (n, 44), sem laços em Python
+    digitos = np.frombuffer(chaves[validas].to_numpy(dtype='S44').tobytes(), dtype=np.uint8)
+    return chaves, validas, digitos.reshape(-1, 44) - np.uint8(ord('0'))
+
+
+def _inteiros(digitos, validas, inicio, fim):
+    # Trecho [inicio, fim) das chaves válidas como int64; zero nas inválidas
+    pesos = 10 ** np.arange(fim - inicio - 1, -1, -1, dtype=np.int64)
+    valores = np.zeros(len(validas), dtype=np.int64)
+    valores[validas] = digitos[:, inicio:fim].astype(np.int64) @ pesos
+    return valores
+
+
+def decodificar_chaves(chaves):
+    """
+    Decodifica as chaves de acesso em um DataFrame com uma coluna por campo,
+    alinhado ao índice de chaves. O CNPJ é mantido como texto (zeros à
+    esquerda) e os demais campos são inteiros (Int64); linhas cuja chave não
+    tem 44 dígitos (inutilizações, por exemplo) ficam com valores nulos.
+    """
+    chaves, validas, digitos = _digitos(chaves)
+
+    colunas = {}
+    for campo, (inicio, fim) in CAMPOS_CHAVE.items():
+        if campo == 'CNPJ':
+            colunas[campo] = chaves.str.slice(inicio, fim).astype('string').where(validas)
+            continue
+        colunas[campo] = pd.arrays.IntegerArray(_inteiros(digitos, validas, inicio, fim), ~validas)
+    return pd.DataFrame(colunas, index=chaves.index)
+
+
+def chaves_para_ordenacao(chaves):
+    """
+    Máscara das chaves válidas e a chave dividida em inteiros (ver
+    TRECHOS_ORDENACAO), do trecho mais significativo para o menos, prontos
+    para np.lexsort. Chaves inválidas ficam com zeros.
+    """
+    _, validas, digitos = _digitos(chaves)
+    return validas, [_inteiros(digitos, validas, inicio, fim) for inicio, fim in TRECHOS_ORDENACAO]
+
+
+def formatar_cnpj(cnpj):
+    """12345678000199 -> 12.345.678/0001-99"""
+    cnpj = str(cnpj)
+    if len(cnpj) != 14 or not cnpj.isdigit():
+        return cnpj
+    return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
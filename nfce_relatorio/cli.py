@@ -0,0 +1,192 @@
+import argparse
+import logging
+import sys
+
+from . import config
+from .cache import abrir_cache
+from .desempenho import Desempenho
+from .entrada import contar_caminhos, iterar_caminhos, ler_antecipado
+from .livro import abrir_livro
+from .numeracao import descrever_grupo, formatar_intervalos, total_pulados
+from .pipeline import executar, executar_acervo, executar_livro
+from .servidor import criar_servidor
+
+
+def _comando_process(args):
+    total = contar_caminhos(args.entradas)
+    print(f"{total} arquivo(s) XML encontrado(s).")
+
+    erros = []
+    desempenho = Desempenho(memoria=args.memoria)
+    # A descompactação acontece na thread de leitura antecipada e é medida lá
+    arquivos = desempenho.medir_iteravel('descompactacao', iterar_caminhos(args.entradas, erros))
+    arquivos_para_processar = ler_antecipado(arquivos)
+    cache = None if args.sem_cache else abrir_cache(args.cache)
+    livro = abrir_livro(args.livro) if args.livro else None
+    try:
+        resultado, df, numeros_pulados, caminhos = executar(
+            arquivos_para_processar, pasta=args.out, total=total, workers=args.workers, cache=cache,
+            acervo=args.acervo, livro=livro, inicio=args.inicio, fim=args.fim, desempenho=desempenho
+        )
+        if livro is not None:
+            print(f"Livro de notas: {len(livro)} nota(s) em {livro.caminho}")
+    finally:
+        if cache is not None:
+            cache.fechar()
+        if livro is not None:
+            livro.fechar()
+    _gravar_desempenho(desempenho, args)
+    for erro in erros:
+        logging.error(erro)
+    for erro in resultado.erros:
+        logging.warning(erro)
+    print(f"Total de itens processados: {resultado.total_itens_processados}")
+    if cache is not None:
+        print(cache.resumo())
+    if resultado.arquivos_nao_processados:
+        print(f"Arquivos não processados: {len(resultado.arquivos_nao_processados)}")
+    if df is None:
+        print("Nenhum arquivo XML válido foi processado.", file=sys.stderr)
+        return 1
+
+    print(resultado.conciliacao.resumo())
+    for chave in resultado.conciliacao.eventos_orfaos['Chave da Nota']:
+        logging.debug("Cancelamento sem a nota: %s", chave)
+    if args.acervo:
+        print(f"Notas gravadas no acervo: {args.acervo}")
+    _imprimir_resultado(df, numeros_pulados, caminhos)
+    return 0
+
+
+def _comando_relatorio(args):
+    origem = 'livro' if args.livro else 'acervo'
+    desempenho = Desempenho(memoria=args.memoria)
+    try:
+        if args.livro:
+            with abrir_livro(args.livro) as livro:
+                df, numeros_pulados, caminhos = executar_livro(
+                    livro, pasta=args.out, inicio=args.inicio, fim=args.fim, cnpjs=args.cnpj, desempenho=desempenho
+                )
+        else:
+            df, numeros_pulados, caminhos = executar_acervo(
+                args.acervo, pasta=args.out, inicio=args.inicio, fim=args.fim, cnpjs=args.cnpj, desempenho=desempenho
+            )
+    except FileNotFoundError as erro:
+        print(erro, file=sys.stderr)
+        return 1
+    _gravar_desempenho(desempenho, args)
+    if df is None:
+        print(f"Nenhuma nota do {origem} atende ao filtro.", file=sys.stderr)
+        return 1
+    print(f"{len(df)} nota(s) lida(s) do {origem}.")
+    _imprimir_resultado(df, numeros_pulados, caminhos)
+    return 0
+
+
+def _comando_servidor(args):
+    servidor = criar_servidor(args.host, args.porta, pasta=args.pasta, workers=args.workers,
+                              token=config.SERVIDOR_TOKEN or None)
+    print(f"Servindo em {servidor.url} (lotes em {servidor.pasta}); Ctrl+C encerra.")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+    return 0
+
+
+def _gravar_desempenho(desempenho, args):
+    for registro in desempenho.etapas.values():
+        logging.debug("Etapa %s: %.3f s, CPU %.3f s, %d item(ns)", registro['etapa'], registro['segundos'],
+                      registro['cpu_segundos'], registro['itens'])
+    if args.desempenho:
+        desempenho.gravar_json(args.desempenho)
+        print(f"Desempenho gravado em {args.desempenho}")
+    if args.prometheus:
+        desempenho.gravar_prometheus(args.prometheus)
+
+
+def _argumentos_desempenho(subparser):
+    subparser.add_argument('--desempenho', default=None, metavar='ARQUIVO.json',
+                           help='grava o tempo, a CPU, os itens e a memória de cada etapa em JSON')
+    subparser.add_argument('--prometheus', default=config.METRICAS_PATH or None, metavar='ARQUIVO.prom',
+                           help='grava as mesmas medições no formato de texto do Prometheus (padrão: NFCE_METRICAS)')
+    subparser.add_argument('--memoria', action='store_true', default=config.DESEMPENHO_MEMORIA,
+                           help='mede o pico de memória de cada etapa com o tracemalloc (bem mais lento; '
+                                'padrão: NFCE_DESEMPENHO_MEMORIA)')
+
+
+def _imprimir_resultado(df, numeros_pulados, caminhos):
+    print(f"Valor Total: R$ {df['Valor Total'].sum():,.2f}")
+    if numeros_pulados:
+        print(f"ATENÇÃO: {total_pulados(numeros_pulados)} numeração(ões) pulada(s):")
+        for grupo, intervalos in numeros_pulados.items():
+            print(f"  {descrever_grupo(grupo)}: {', '.join(formatar_intervalos(intervalos))}")
+    else:
+        print("Todas as NFCe estão com numeração contínua.")
+    for caminho in caminhos.values():
+        print(f"Gerado: {caminho}")
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m nfce_relatorio',
+        description='Processa XML de NFCe e gera os relatórios sem a interface Streamlit.'
+    )
+    parser.add_argument('-v', '--verbose', action='store_true', help='exibe mensagens de depuração')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    process = subparsers.add_parser('process', help='processa diretórios, ZIP ou XML e gera os relatórios')
+    process.add_argument('entradas', nargs='+', help='diretórios, arquivos .zip ou arquivos .xml')
+    process.add_argument('--out', default='reports', help='pasta de saída dos relatórios (padrão: reports)')
+    process.add_argument('--workers', type=int, default=None,
+                         help='processos de leitura dos XML (padrão: NFCE_WORKERS ou número de CPUs; 1 = sequencial)')
+    process.add_argument('--cache', default=None,
+                         help='arquivo SQLite do cache de registros (padrão: NFCE_CACHE ou dados/cache_registros.sqlite3)')
+    process.add_argument('--sem-cache', action='store_true', help='não consulta nem grava o cache de registros')
+    process.add_argument('--acervo', nargs='?', const=config.ACERVO_PATH, default=None,
+                         help='grava também as notas no acervo Parquet (padrão: NFCE_ACERVO ou dados/acervo)')
+    process.add_argument('--livro', nargs='?', const=config.LIVRO_PATH, default=None,
+                         help='acumula as notas no livro SQLite, lendo só os arquivos novos, e gera os relatórios '
+                              'a partir dele (padrão: NFCE_LIVRO ou dados/livro.sqlite3)')
+    process.add_argument('--inicio', default=None, help='com --livro, primeiro mês dos relatórios (AAAA-MM)')
+    process.add_argument('--fim', default=None, help='com --livro, último mês dos relatórios (AAAA-MM)')
+    _argumentos_desempenho(process)
+    process.set_defaults(func=_comando_process)
+
+    relatorio = subparsers.add_parser(
+        'relatorio', help='gera os relatórios a partir do acervo Parquet ou do livro de notas, sem reler os XML'
+    )
+    relatorio.add_argument('--acervo', default=config.ACERVO_PATH,
+                           help='pasta do acervo Parquet (padrão: NFCE_ACERVO ou dados/acervo)')
+    relatorio.add_argument('--livro', nargs='?', const=config.LIVRO_PATH, default=None,
+                           help='lê as notas do livro SQLite em vez do acervo (padrão: NFCE_LIVRO ou dados/livro.sqlite3)')
+    relatorio.add_argument('--inicio', default=None, help='primeiro mês (AAAA-MM)')
+    relatorio.add_argument('--fim', default=None, help='último mês (AAAA-MM)')
+    relatorio.add_argument('--cnpj', action='append', default=None,
+                           help='CNPJ do emitente, só dígitos (pode ser repetido; padrão: todos)')
+    relatorio.add_argument('--out', default='reports', help='pasta de saída dos relatórios (padrão: reports)')
+    _argumentos_desempenho(relatorio)
+    relatorio.set_defaults(func=_comando_relatorio)
+
+    servidor = subparsers.add_parser(
+        'servidor', help='serviço HTTP para enviar ZIP/XML e buscar os totais e os relatórios (para ERPs)'
+    )
+    servidor.add_argument('--host', default='127.0.0.1', help='endereço de escuta (padrão: 127.0.0.1)')
+    servidor.add_argument('--porta', type=int, default=8502, help='porta (padrão: 8502)')
+    servidor.add_argument('--pasta', default=config.SERVIDOR_PASTA,
+                          help='pasta dos lotes recebidos e dos relatórios (padrão: NFCE_SERVIDOR_PASTA ou dados/servidor)')
+    servidor.add_argument('--workers', type=int, default=None,
+                          help='lotes processados ao mesmo tempo (padrão: NFCE_TAREFAS_WORKERS)')
+    servidor.set_defaults(func=_comando_servidor)
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(levelname)s: %(message)s'
+    )
+    return args.func(args)
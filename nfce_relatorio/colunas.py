@@ -0,0 +1,167 @@
+from array import array
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+class _ColunaValor:
+    """Números em um array('d')"""
+
+    def __init__(self):
+        self.valores = array('d')
+
+    def acrescentar(self, valor):
+        try:
+            self.valores.append(float(valor))
+        except (TypeError, ValueError):
+            self.valores.append(np.nan)
+
+    def valor(self, posicao):
+        return self.valores[posicao]
+
+    def para_pandas(self):
+        return np.frombuffer(self.valores, dtype=np.float64) if self.valores else np.array([], dtype=np.float64)
+
+
+class _ColunaCategoria:
+    """Textos repetitivos codificados por dicionário: códigos em array('i') e cada valor guardado uma vez"""
+
+    def __init__(self):
+        self.codigos = array('i')
+        self.categorias = []
+        self._indice = {}
+
+    def acrescentar(self, valor):
+        if valor is None:
+            self.codigos.append(-1)
+            return
+        if not isinstance(valor, str):
+            valor = str(valor)
+        codigo = self._indice.get(valor)
+        if codigo is None:
+            codigo = self._indice[valor] = len(self.categorias)
+            self.categorias.append(valor)
+        self.codigos.append(codigo)
+
+    def valor(self, posicao):
+        codigo = self.codigos[posicao]
+        return None if codigo < 0 else self.categorias[codigo]
+
+    def para_pandas(self):
+        codigos = np.frombuffer(self.codigos, dtype=np.int32) if self.codigos else np.array([], dtype=np.int32)
+        return pd.Categorical.from_codes(codigos, categories=pd.Index(self.categorias, dtype=object))
+
+
+class _ColunaTexto:
+    """
+    Textos quase sempre distintos (data, chave, número, protocolo), concatenados em
+    UTF-8 em um único bytearray, com as posições de cada um em um array('q')
+    """
+
+    def __init__(self):
+        self.dados = bytearray()
+        self.posicoes = array('q', [0])
+        self.nulos = set()
+
+    def acrescentar(self, valor):
+        if valor is None:
+            self.nulos.add(len(self.posicoes) - 1)
+        else:
+            self.dados += (valor if isinstance(valor, str) else str(valor)).encode('utf-8')
+        self.posicoes.append(len(self.dados))
+
+    def valor(self, posicao):
+        if posicao in self.nulos:
+            return None
+        return self.dados[self.posicoes[posicao]:self.posicoes[posicao + 1]].decode('utf-8')
+
+    def para_pandas(self):
+        tamanho = len(self.posicoes) - 1
+        if pa is None:
+            return [self.valor(posicao) for posicao in range(tamanho)]
+        # Com pyarrow, os buffers viram a coluna de texto do pandas sem copiar
+        validos = None
+        if self.nulos:
+            mascara = np.ones(tamanho, dtype=bool)
+            mascara[list(self.nulos)] = False
+            validos = pa.py_buffer(np.packbits(mascara, bitorder='little'))
+        textos = pa.LargeStringArray.from_buffers(
+            tamanho, pa.py_buffer(self.posicoes), pa.py_buffer(self.dados), validos, len(self.nulos)
+        )
+        return pd.Series(textos, dtype='str')
+
+
+# Tipo de armazenamento de cada campo dos registros do parser
+TIPOS_COLUNAS = {
+    'Data Emissão': _ColunaTexto,
+    'Chave da Nota': _ColunaTexto,
+    'Número NFCe': _ColunaTexto,
+    'Destinatário': _ColunaCategoria,
+    'CPF/CNPJ Destinatário': _ColunaCategoria,
+    'Valor Total': _ColunaValor,
+    'Status': _ColunaCategoria,
+    'Protocolo': _ColunaTexto,
+    'Justificativa': _ColunaCategoria,
+    'Situação': _ColunaCategoria,
+}
+
+
+class ColunasRegistros:
+    """
+    Acumula os registros do parser coluna a coluna, sem guardar um dicionário
+    por nota: valores em arrays tipados, textos distintos em um único buffer e
+    textos repetitivos (status, 'Não se aplica'...) codificados por
+    dicionário. para_dataframe entrega as colunas ao pandas sem copiá-las.
+    """
+
+    def __init__(self):
+        self.colunas = {}
+        self._tamanho = 0
+
+    def acrescentar(self, registro):
+        if not self.colunas:
+            self.colunas = {campo: TIPOS_COLUNAS.get(campo, _ColunaTexto)() for campo in registro}
+        elif registro.keys() != self.colunas.keys():
+            self._completar_campos(registro)
+        for campo, coluna in self.colunas.items():
+            coluna.acrescentar(registro.get(campo))
+        self._tamanho += 1
+
+    def estender(self, registros):
+        for registro in registros:
+            self.acrescentar(registro)
+
+    def _completar_campos(self, registro):
+        # Campo novo: as linhas anteriores ficam sem valor
+        for campo in registro:
+            if campo not in self.colunas:
+                coluna = TIPOS_COLUNAS.get(campo, _ColunaTexto)()
+                for _ in range(self._tamanho):
+                    coluna.acrescentar(None)
+                self.colunas[campo] = coluna
+
+    def __len__(self):
+        return self._tamanho
+
+    def __getitem__(self, posicao):
+        if posicao < 0:
+            posicao += self._tamanho
+        if not 0 <= posicao < self._tamanho:
+            raise IndexError(posicao)
+        return {campo: coluna.valor(posicao) for campo, coluna in self.colunas.items()}
+
+    def __iter__(self):
+        for posicao in range(self._tamanho):
+            yield self[posicao]
+
+    def para_dataframe(self):
+        colunas = {}
+        for campo, coluna in self.colunas.items():
+            valores = coluna.para_pandas()
+            colunas[campo] = valores.array if isinstance(valores, pd.Series) else valores
+        return pd.DataFrame(colunas, copy=False)
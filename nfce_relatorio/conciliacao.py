@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+from .situacao import CANCELADA, STATUS_NOTA_CANCELADA, eventos_cancelamento, prioridades
+
+
+class ResultadoConciliacao:
+    """
+    DataFrame conciliado e o que a conciliação encontrou: quantas notas foram
+    canceladas por um evento, quantos registros repetidos foram descartados e
+    os eventos de cancelamento cuja nota não estava entre os arquivos
+    """
+
+    def __init__(self, df, canceladas, duplicadas, eventos_orfaos):
+        self.df = df
+        self.canceladas = canceladas
+        self.duplicadas = duplicadas
+        self.eventos_orfaos = eventos_orfaos
+
+    def resumo(self):
+        return (f"Conciliação: {self.canceladas} nota(s) cancelada(s) por evento, "
+                f"{self.duplicadas} registro(s) repetido(s) descartado(s), "
+                f"{len(self.eventos_orfaos)} evento(s) de cancelamento sem a nota")
+
+
+def _identidades(df):
+    # Chave de acesso; sem ela (inutilizações), a faixa não é única entre
+    # emitentes e é completada com protocolo e data, como no livro de notas
+    chaves = df['Chave da Nota'].astype(str)
+    validas = chaves.str.fullmatch(r'\d{44}').to_numpy(dtype=bool)
+    if validas.all():
+        return chaves
+    sem_chave = ~validas
+    extras = (
+        chaves[sem_chave] + '|' + df['Protocolo'][sem_chave].astype(str).fillna('')
+        + '|' + df['Data Emissão'][sem_chave].astype(str).fillna('')
+    )
+    return chaves.where(validas, extras)
+
+
+def _ultima_de_cada(posicoes, codigos):
+    # A última ocorrência de cada código entre as posições (a do arquivo mais recente)
+    repetidas = pd.Series(codigos[posicoes], copy=False).duplicated(keep='last').to_numpy()
+    return posicoes[~repetidas]
+
+
+def _atribuir(df, coluna, posicoes, valores):
+    serie = df[coluna]
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        novas = pd.Index(pd.unique(valores[pd.notna(valores)])).difference(serie.cat.categories)
+        if len(novas):
+            serie = serie.cat.add_categories(novas)
+    else:
+        serie = serie.copy()
+    serie.iloc[posicoes] = valores
+    df[coluna] = serie
+
+
+def conciliar(df):
+    """
+    Junta cada evento de cancelamento à nota da mesma chave de acesso, em uma
+    junção por hash linear no tamanho de df (montar_dataframe):
+    - a nota passa a CANCELADA, com o status STATUS_NOTA_CANCELADA e a
+      justificativa do evento, mantendo data, valor, destinatário e protocolo;
+      a linha do evento sai do DataFrame;
+    - registros repetidos da mesma chave (o mesmo XML enviado de novo, ou a
+      nota sem protocolo e depois autorizada) viram um só: o de maior
+      prioridade (situacao.PRIORIDADE_SITUACAO) e, no empate, o último;
+    - eventos sem a nota entre os registros continuam no DataFrame e são
+      listados em eventos_orfaos.
+    A ordem das linhas é mantida. Retorna um ResultadoConciliacao.
+    """
+    if df.empty:
+        return ResultadoConciliacao(df, 0, 0, df)
+
+    # Índice por hash: cada chave vira um código inteiro
+    codigos, unicas = pd.factorize(_identidades(df))
+    evento = eventos_cancelamento(df)
+    prioridade = prioridades(df)
+
+    # Notas: a de maior prioridade de cada chave
+    notas = np.flatnonzero(~evento)
+    maxima = pd.Series(prioridade[notas], copy=False).groupby(codigos[notas], sort=False).transform('max')
+    notas_mantidas = _ultima_de_cada(notas[prioridade[notas] == maxima.to_numpy()], codigos)
+    eventos = np.flatnonzero(evento)
+    eventos_mantidos = _ultima_de_cada(eventos, codigos)
+
+    # Junção: posição do evento de cada chave e se a chave tem nota
+    evento_da_chave = np.full(len(unicas), -1, dtype=np.int64)
+    evento_da_chave[codigos[eventos_mantidos]] = eventos_mantidos
+    tem_nota = np.zeros(len(unicas), dtype=bool)
+    tem_nota[codigos[notas_mantidas]] = True
+    casados = evento_da_chave[codigos[notas_mantidas]]
+    canceladas = notas_mantidas[casados >= 0]
+    eventos_casados = casados[casados >= 0]
+    orfaos = eventos_mantidos[~tem_nota[codigos[eventos_mantidos]]]
+
+    manter = np.zeros(len(df), dtype=bool)
+    manter[notas_mantidas] = True
+    manter[orfaos] = True
+    resultado = df[manter]
+    if len(canceladas):
+        # Posições das notas canceladas dentro de resultado
+        posicoes = np.cumsum(manter)[canceladas] - 1
+        justificativas = df['Justificativa'].iloc[eventos_casados].to_numpy(dtype=object)
+        _atribuir(resultado, 'Status', posicoes, np.full(len(posicoes), STATUS_NOTA_CANCELADA, dtype=object))
+        _atribuir(resultado, 'Justificativa', posicoes, justificativas)
+        _atribuir(resultado, 'Situação', posicoes, np.full(len(posicoes), CANCELADA, dtype=object))
+
+    duplicadas = len(notas) - len(notas_mantidas) + len(eventos) - len(eventos_mantidos)
+    return ResultadoConciliacao(resultado, len(canceladas), duplicadas, df.iloc[orfaos])
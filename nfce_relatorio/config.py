@@ -0,0 +1,46 @@
+import os
+
+# Diretório raiz do projeto (um nível acima do pacote)
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Logo usada no cabeçalho dos relatórios PDF
+LOGO_PATH = os.path.join(PROJECT_DIR, 'app', 'logo_empresa.png')
+
+# Número de processos usados na leitura dos XML (NFCE_WORKERS=1 desativa o paralelismo)
+WORKERS = int(os.environ.get('NFCE_WORKERS', '0')) or os.cpu_count() or 1
+
+# Cache persistente dos registros extraídos (NFCE_CACHE vazio desativa)
+CACHE_PATH = os.environ.get('NFCE_CACHE', os.path.join(PROJECT_DIR, 'dados', 'cache_registros.sqlite3'))
+CACHE_LIMITE_MB = int(os.environ.get('NFCE_CACHE_MB', '512'))
+
+# Acervo Parquet das notas processadas, particionado por CNPJ, ano e mês
+ACERVO_PATH = os.environ.get('NFCE_ACERVO', os.path.join(PROJECT_DIR, 'dados', 'acervo'))
+
+# Livro SQLite com as notas de todos os envios, uma linha por chave de acesso
+LIVRO_PATH = os.environ.get('NFCE_LIVRO', os.path.join(PROJECT_DIR, 'dados', 'livro.sqlite3'))
+
+# Medição de desempenho: NFCE_DESEMPENHO_MEMORIA=1 mede o pico de memória de cada
+# etapa com o tracemalloc (mais lento); NFCE_METRICAS é o arquivo .prom gravado a
+# cada processamento para o Prometheus (vazio desativa)
+DESEMPENHO_MEMORIA = os.environ.get('NFCE_DESEMPENHO_MEMORIA', '') not in ('', '0')
+METRICAS_PATH = os.environ.get('NFCE_METRICAS', '')
+
+# Fila de processamentos da interface: threads que processam os envios em segundo
+# plano (atendidas em rodízio entre as sessões) e por quantos segundos um resultado
+# não buscado é guardado
+TAREFAS_WORKERS = int(os.environ.get('NFCE_TAREFAS_WORKERS', '1')) or 1
+TAREFAS_VALIDADE = int(os.environ.get('NFCE_TAREFAS_VALIDADE', '3600'))
+
+# Serviço HTTP de envio de lotes (python -m nfce_relatorio servidor): pasta dos
+# arquivos recebidos e dos relatórios, maior arquivo aceito, dias que um lote
+# terminado é guardado e token exigido dos clientes (vazio: sem token)
+SERVIDOR_PASTA = os.environ.get('NFCE_SERVIDOR_PASTA', os.path.join(PROJECT_DIR, 'dados', 'servidor'))
+SERVIDOR_LIMITE_MB = int(os.environ.get('NFCE_SERVIDOR_LIMITE_MB', '2048'))
+SERVIDOR_VALIDADE_DIAS = float(os.environ.get('NFCE_SERVIDOR_VALIDADE_DIAS', '7'))
+SERVIDOR_TOKEN = os.environ.get('NFCE_SERVIDOR_TOKEN', '')
+
+# Limites de cada ZIP lido, contra arquivos maliciosos ("zip bombs"): XML por ZIP,
+# tamanho descompactado de cada XML e total descompactado do ZIP
+ZIP_MAX_MEMBROS = int(os.environ.get('NFCE_ZIP_MAX_MEMBROS', '5000000'))
+ZIP_MAX_XML_MB = int(os.environ.get('NFCE_ZIP_MAX_XML_MB', '50'))
+ZIP_MAX_TOTAL_MB = int(os.environ.get('NFCE_ZIP_MAX_TOTAL_MB', str(100 * 1024)))
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+# Fuso das datas exibidas nos relatórios
+FUSO = 'America/Sao_Paulo'
+
+# Formato das datas da NF-e (AAAA-MM-DDThh:mm:ssTZD): data e hora nos 19
+# primeiros caracteres, seguidas do offset (-03:00), de Z ou de nada
+_DATA_HORA = r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}'
+_OFFSET = r'(?:[+-]\d{2}:?\d{2}|Z)?'
+
+
+def converter_datas(valores, fuso=FUSO):
+    """
+    Converte de uma só vez os textos ISO 8601 do XML (dhEmi, dhEvento,
+    dhRecbto) em datas no fuso de São Paulo (datetime64[ns, fuso]).
+    Textos com offset são convertidos pelo instante que representam; textos
+    sem offset são considerados já no horário local. Vazios e textos
+    inválidos viram NaT.
+    """
+    tipo = f'datetime64[ns, {fuso}]'
+    valores = pd.Series(valores)
+    if isinstance(valores.dtype, pd.DatetimeTZDtype):
+        return valores.dt.tz_convert(fuso).astype(tipo)
+    if pd.api.types.is_datetime64_dtype(valores.dtype):
+        return _localizar(valores, fuso).astype(tipo)
+
+    textos = valores.astype(object).where(valores.notna(), '').astype(str).str.strip()
+    resultado = pd.Series(pd.NaT, index=textos.index, dtype=tipo)
+    if textos.empty:
+        return resultado
+
+    # Caso comum: data e hora em formato fixo, convertidas pelo caminho rápido
+    # do pandas; cada offset distinto (quase sempre só -03:00) é lido uma vez
+    data_hora, offsets = textos.str.slice(0, 19), textos.str.slice(19)
+    padrao = (data_hora.str.fullmatch(_DATA_HORA) & offsets.str.fullmatch(_OFFSET)).to_numpy(dtype=bool)
+    if padrao.any():
+        datas = pd.to_datetime(data_hora[padrao], format='%Y-%m-%dT%H:%M:%S', errors='coerce')
+        codigos, distintos = pd.factorize(offsets[padrao])
+        minutos = np.array([_minutos_offset(offset) for offset in distintos], dtype=np.int64)[codigos]
+        instantes = (datas - pd.to_timedelta(minutos, unit='m')).dt.tz_localize('UTC').dt.tz_convert(fuso)
+        sem_offset = (offsets[padrao] == '').to_numpy(dtype=bool)
+        if sem_offset.any():
+            instantes = instantes.where(~sem_offset, _localizar(datas, fuso))
+        resultado[padrao] = instantes.astype(tipo)
+
+    # Demais textos (frações de segundo, só a data...): conversão ISO 8601 genérica
+    outros = ~padrao & (textos != '').to_numpy(dtype=bool)
+    if outros.any():
+        resultado[outros] = _converter_iso(textos[outros], fuso).astype(tipo)
+    return resultado
+
+
+def _minutos_offset(offset):
+    # '-03:00' -> -180; 'Z' e '' -> 0
+    if offset in ('', 'Z'):
+        return 0
+    horas, minutos = int(offset[1:3]), int(offset[-2:])
+    return (horas * 60 + minutos) * (-1 if offset[0] == '-' else 1)
+
+
+def _converter_iso(textos, fuso):
+    com_offset = textos.str.contains(r'(?:[+-]\d{2}:?\d{2}|Z)$')
+    convertidas = pd.to_datetime(textos.where(com_offset), utc=True, format='ISO8601', errors='coerce')
+    locais = _localizar(pd.to_datetime(textos.where(~com_offset), format='ISO8601', errors='coerce'), fuso)
+    return convertidas.dt.tz_convert(fuso).where(com_offset, locais)
+
+
+def _localizar(datas, fuso):
+    # Horário local sem fuso -> fuso; horários inexistentes ou ambíguos (horário de verão) são ajustados
+    return datas.dt.tz_localize(fuso, ambiguous='NaT', nonexistent='shift_forward')
+
+
+def horario_local(datas):
+    """Datas com fuso como horário local sem fuso (o Excel não aceita fuso); outras colunas inalteradas"""
+    if isinstance(datas.dtype, pd.DatetimeTZDtype):
+        return datas.dt.tz_localize(None)
+    return datas
+
+
+def sem_fuso(df):
+    """Cópia rasa de df com as colunas de data com fuso em horário local sem fuso"""
+    colunas = [col for col in df.columns if isinstance(df[col].dtype, pd.DatetimeTZDtype)]
+    if not colunas:
+        return df
+    return df.assign(**{col: horario_local(df[col]) for col in colunas})
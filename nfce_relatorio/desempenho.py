@@ -0,0 +1,185 @@
+import json
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Campos de cada etapa, na ordem do JSON e da tabela da interface
+CAMPOS_ETAPA = ['etapa', 'segundos', 'cpu_segundos', 'itens', 'chamadas', 'memoria_pico_bytes', 'rss_pico_bytes']
+
+# Métricas Prometheus: campo da etapa -> (nome da métrica, descrição)
+METRICAS_PROMETHEUS = {
+    'segundos': ('nfce_etapa_duracao_segundos', 'Tempo de relógio gasto em cada etapa do processamento'),
+    'cpu_segundos': ('nfce_etapa_cpu_segundos', 'Tempo de CPU gasto em cada etapa do processamento'),
+    'itens': ('nfce_etapa_itens', 'Itens (arquivos, registros ou linhas) tratados em cada etapa'),
+    'chamadas': ('nfce_etapa_chamadas', 'Vezes que cada etapa foi executada'),
+    'memoria_pico_bytes': ('nfce_etapa_memoria_pico_bytes',
+                           'Pico de memória alocada pelo Python em cada etapa (tracemalloc)'),
+    'rss_pico_bytes': ('nfce_etapa_rss_pico_bytes', 'Pico de memória do processo (RSS) ao fim de cada etapa'),
+}
+
+
+def rss_pico():
+    """Pico de memória residente do processo até agora, em bytes (None se indisponível)"""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    return pico if sys.platform == 'darwin' else pico * 1024
+
+
+class Desempenho:
+    """
+    Medições das etapas de um processamento: tempo de relógio, tempo de CPU,
+    itens tratados e memória. Etapas podem ser aninhadas (a de fora inclui as
+    de dentro); uma etapa repetida acumula os tempos e os itens.
+    Com memoria=True, o pico de memória alocada em cada etapa vem do
+    tracemalloc, que só fica ativo durante as etapas, mas deixa a leitura dos
+    XML cerca de 5 vezes mais lenta. Sem ele, registra-se apenas o pico de
+    memória do processo (RSS) ao fim de cada etapa.
+    """
+
+    def __init__(self, memoria=False):
+        self.memoria = memoria
+        self.inicio = datetime.now()
+        self.etapas = {}
+        # Picos do tracemalloc das etapas abertas: [memória no início, maior pico]
+        self._picos = []
+        self._tracemalloc_proprio = False
+
+    def _registro(self, nome):
+        registro = self.etapas.get(nome)
+        if registro is None:
+            registro = self.etapas[nome] = {
+                'etapa': nome, 'segundos': 0.0, 'cpu_segundos': 0.0, 'itens': 0, 'chamadas': 0,
+                'memoria_pico_bytes': None, 'rss_pico_bytes': None,
+            }
+        return registro
+
+    def _abrir_memoria(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracemalloc_proprio = True
+        atual, pico = tracemalloc.get_traced_memory()
+        # O pico é global: o da etapa de fora é guardado antes de zerá-lo
+        if self._picos:
+            self._picos[-1][1] = max(self._picos[-1][1], pico)
+        tracemalloc.reset_peak()
+        self._picos.append([atual, atual])
+
+    def _fechar_memoria(self):
+        inicio, pico = self._picos.pop()
+        pico = max(pico, tracemalloc.get_traced_memory()[1])
+        if self._picos:
+            self._picos[-1][1] = max(self._picos[-1][1], pico)
+        elif self._tracemalloc_proprio:
+            tracemalloc.stop()
+            self._tracemalloc_proprio = False
+        return pico - inicio
+
+    @contextmanager
+    def etapa(self, nome, itens=0):
+        """
+        Mede o bloco como a etapa nome. O registro da etapa é entregue ao
+        bloco, que pode somar a 'itens' o que tratou.
+        """
+        registro = self._registro(nome)
+        registro['itens'] += itens
+        if self.memoria:
+            self._abrir_memoria()
+        relogio, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield registro
+        finally:
+            registro['segundos'] += time.perf_counter() - relogio
+            registro['cpu_segundos'] += time.process_time() - cpu
+            registro['chamadas'] += 1
+            if self.memoria:
+                memoria = self._fechar_memoria()
+                registro['memoria_pico_bytes'] = max(registro['memoria_pico_bytes'] or 0, memoria)
+            registro['rss_pico_bytes'] = rss_pico()
+
+    def acumular(self, nome, segundos, cpu_segundos=0.0, itens=1):
+        """Soma à etapa nome um tempo medido fora dela (por arquivo, em outro processo ou thread)"""
+        registro = self._registro(nome)
+        registro['segundos'] += segundos
+        registro['cpu_segundos'] += cpu_segundos
+        registro['itens'] += itens
+        registro['chamadas'] += 1
+
+    def medir_iteravel(self, nome, iteravel):
+        """
+        Repassa os itens de iteravel somando à etapa nome o tempo gasto em
+        produzi-los (a descompactação dos ZIP, por exemplo). O tempo de CPU é
+        o da thread que consome o iterável.
+        """
+        iterador = iter(iteravel)
+        while True:
+            relogio, cpu = time.perf_counter(), time.thread_time()
+            try:
+                item = next(iterador)
+            except StopIteration:
+                return
+            self.acumular(nome, time.perf_counter() - relogio, time.thread_time() - cpu)
+            yield item
+
+    def para_dict(self):
+        return {
+            'inicio': self.inicio.isoformat(timespec='seconds'),
+            'memoria': self.memoria,
+            'etapas': [{campo: registro[campo] for campo in CAMPOS_ETAPA} for registro in self.etapas.values()],
+        }
+
+    def para_json(self):
+        return json.dumps(self.para_dict(), ensure_ascii=False, indent=2)
+
+    def para_prometheus(self):
+        """Medições no formato de texto do Prometheus (uma série por etapa)"""
+        linhas = []
+        for campo, (metrica, descricao) in METRICAS_PROMETHEUS.items():
+            valores = [(nome, registro[campo]) for nome, registro in self.etapas.items() if registro[campo] is not None]
+            if not valores:
+                continue
+            linhas.append(f'# HELP {metrica} {descricao}')
+            linhas.append(f'# TYPE {metrica} gauge')
+            for nome, valor in valores:
+                linhas.append(f'{metrica}{{etapa="{_rotulo(nome)}"}} {valor:.6g}')
+        linhas.append('# HELP nfce_processamento_inicio_segundos Início do último processamento (Unix)')
+        linhas.append('# TYPE nfce_processamento_inicio_segundos gauge')
+        linhas.append(f'nfce_processamento_inicio_segundos {self.inicio.timestamp():.3f}')
+        return '\n'.join(linhas) + '\n'
+
+    def gravar_json(self, caminho):
+        _gravar_atomico(caminho, self.para_json())
+
+    def gravar_prometheus(self, caminho):
+        """Grava o arquivo .prom (o coletor textfile do node_exporter lê a pasta a cada coleta)"""
+        _gravar_atomico(caminho, self.para_prometheus())
+
+
+def _rotulo(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _gravar_atomico(caminho, texto):
+    # O arquivo nunca é lido pela metade: grava ao lado e troca de uma vez
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    temporario = os.path.join(pasta, f'.{uuid.uuid4().hex}.tmp')
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        arquivo.write(texto)
+    os.replace(temporario, caminho)
+
+
+def etapa(desempenho, nome, itens=0):
+    """desempenho.etapa(nome), ou um bloco sem medição quando desempenho é None"""
+    return nullcontext({'itens': 0}) if desempenho is None else desempenho.etapa(nome, itens)
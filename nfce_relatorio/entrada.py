@@ -0,0 +1,247 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import zipfile
+
+from . import config
+
+# Trechos copiados por vez para o disco
+TAMANHO_BLOCO = 1024 * 1024
+
+
+class ZipInseguroError(ValueError):
+    """ZIP ou XML além dos limites de config (quantidade de membros ou tamanho descompactado)"""
+
+
+def ignorar_membro(nome):
+    """Indica se um membro de ZIP é um arquivo oculto do MacOS"""
+    return nome.startswith('__MACOSX') or os.path.basename(nome).startswith('._')
+
+
+def _membros_xml(z):
+    for zipinfo in z.infolist():
+        if ignorar_membro(zipinfo.filename):
+            continue
+        if zipinfo.filename.lower().endswith('.xml'):
+            yield zipinfo
+
+
+def _megabytes(limite):
+    return f"{limite / 1024 / 1024:g} MB"
+
+
+def ler_limitado(arquivo, limite, nome):
+    """Lê arquivo (aberto) inteiro, sem nunca passar de limite bytes na memória"""
+    conteudo = arquivo.read(limite + 1)
+    if len(conteudo) > limite:
+        raise ZipInseguroError(f"{nome} passa de {_megabytes(limite)} descompactado")
+    return conteudo
+
+
+def iterar_zip(arquivo, max_membros=None, max_xml=None, max_total=None):
+    """
+    Gera uma tupla (conteudo_xml, nome_do_membro) por XML de um arquivo ZIP
+    (caminho ou objeto de arquivo). Cada membro é descompactado apenas quando
+    solicitado, e o conteúdo é entregue em bytes, sem decodificar.
+    Para não estourar a memória nem o tempo com um ZIP malicioso, levanta
+    ZipInseguroError se o ZIP tem mais de max_membros XML, se um XML passa
+    de max_xml bytes descompactado ou se o total descompactado passa de
+    max_total bytes (padrões em config). A quantidade e os tamanhos
+    declarados no diretório central são conferidos antes de entregar o
+    primeiro XML, para que um ZIP recusado não seja lido pela metade; os
+    tamanhos lidos são conferidos durante, contra ZIP que declara menos do que tem.
+    """
+    max_membros = config.ZIP_MAX_MEMBROS if max_membros is None else max_membros
+    max_xml = config.ZIP_MAX_XML_MB * 1024 * 1024 if max_xml is None else max_xml
+    max_total = config.ZIP_MAX_TOTAL_MB * 1024 * 1024 if max_total is None else max_total
+    with zipfile.ZipFile(arquivo) as z:
+        membros = list(_membros_xml(z))
+        if len(membros) > max_membros:
+            raise ZipInseguroError(f"{len(membros)} XML no ZIP (limite: {max_membros})")
+        for zipinfo in membros:
+            if zipinfo.file_size > max_xml:
+                raise ZipInseguroError(f"{zipinfo.filename} passa de {_megabytes(max_xml)} descompactado")
+        declarado = sum(zipinfo.file_size for zipinfo in membros)
+        if declarado > max_total:
+            raise ZipInseguroError(f"{_megabytes(declarado)} descompactados (limite: {_megabytes(max_total)})")
+        total = 0
+        for zipinfo in membros:
+            with z.open(zipinfo) as xmlfile:
+                conteudo = ler_limitado(xmlfile, max_xml, zipinfo.filename)
+            total += len(conteudo)
+            if total > max_total:
+                raise ZipInseguroError(f"mais de {_megabytes(max_total)} descompactados")
+            yield conteudo, zipinfo.filename
+
+
+def iterar_arquivos(arquivos, erros=None):
+    """
+    Gera (conteudo_xml, nome) para arquivos XML e ZIP enviados (objetos com
+    .name e .read(), como o UploadedFile do Streamlit).
+    Mensagens de erro de descompactação são acrescentadas à lista erros.
+    """
+    for arquivo in arquivos:
+        nome = arquivo.name
+        if nome.lower().endswith('.zip'):
+            try:
+                yield from iterar_zip(arquivo)
+            except Exception as e:
+                if erros is not None:
+                    erros.append(f"Erro ao descompactar {nome}: {str(e)}")
+        elif nome.lower().endswith('.xml'):
+            try:
+                conteudo = ler_limitado(arquivo, config.ZIP_MAX_XML_MB * 1024 * 1024, nome)
+            except ZipInseguroError as e:
+                if erros is not None:
+                    erros.append(f"Arquivo ignorado: {str(e)}")
+                continue
+            yield conteudo, nome
+
+
+class ArquivoEmDisco:
+    """
+    Cópia de um arquivo enviado (objeto com .name e .read(), como o
+    UploadedFile do Streamlit) em um arquivo temporário no disco, feita em
+    blocos. Mantém o nome original em .name e repassa read, seek e tell ao
+    arquivo temporário, então serve a iterar_arquivos e contar_xmls sem
+    guardar o conteúdo na memória. O temporário some ao fechar.
+    """
+
+    def __init__(self, origem, pasta=None):
+        self.name = origem.name
+        self.arquivo = tempfile.TemporaryFile(dir=pasta)
+        try:
+            if hasattr(origem, 'seek'):
+                origem.seek(0)
+            shutil.copyfileobj(origem, self.arquivo, TAMANHO_BLOCO)
+            self.size = self.arquivo.tell()
+            self.arquivo.seek(0)
+        except BaseException:
+            self.arquivo.close()
+            raise
+
+    def __getattr__(self, nome):
+        return getattr(self.arquivo, nome)
+
+    def close(self):
+        self.arquivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def contar_xmls(arquivos):
+    """
+    Conta os XML contidos nos arquivos enviados lendo apenas o diretório
+    central dos ZIP (sem descompactar). Usado para a barra de progresso.
+    """
+    total = 0
+    for arquivo in arquivos:
+        nome = arquivo.name.lower()
+        if nome.endswith('.zip'):
+            try:
+                with zipfile.ZipFile(arquivo) as z:
+                    total += sum(1 for _ in _membros_xml(z))
+            except Exception:
+                pass
+            arquivo.seek(0)
+        elif nome.endswith('.xml'):
+            total += 1
+    return total
+
+
+def listar_caminhos(caminhos):
+    """
+    Expande diretórios em seus arquivos .xml e .zip (recursivamente, em ordem alfabética).
+    Caminhos de arquivos são mantidos como estão.
+    """
+    for caminho in caminhos:
+        if os.path.isdir(caminho):
+            for raiz, dirs, nomes in os.walk(caminho):
+                dirs.sort()
+                for nome in sorted(nomes):
+                    if nome.lower().endswith(('.xml', '.zip')) and not nome.startswith('._'):
+                        yield os.path.join(raiz, nome)
+        else:
+            yield caminho
+
+
+def iterar_caminhos(caminhos, erros=None):
+    """Versão de iterar_arquivos para caminhos no disco (arquivos ou diretórios)"""
+    for caminho in listar_caminhos(caminhos):
+        try:
+            f = open(caminho, 'rb')
+        except OSError as e:
+            if erros is not None:
+                erros.append(f"Erro ao abrir {caminho}: {str(e)}")
+            continue
+        with f:
+            yield from iterar_arquivos([f], erros)
+
+
+def contar_caminhos(caminhos):
+    """Versão de contar_xmls para caminhos no disco"""
+    total = 0
+    for caminho in listar_caminhos(caminhos):
+        try:
+            with open(caminho, 'rb') as f:
+                total += contar_xmls([f])
+        except OSError:
+            pass
+    return total
+
+
+class _Fim:
+    """Marca o fim da leitura antecipada, carregando a exceção do produtor, se houver"""
+
+    def __init__(self, erro=None):
+        self.erro = erro
+
+
+def ler_antecipado(iteravel, tamanho=32):
+    """
+    Consome o iterável em uma thread auxiliar, mantendo no máximo `tamanho`
+    itens prontos na fila. Assim a descompactação dos próximos membros do ZIP
+    (o zlib libera o GIL) acontece enquanto o item atual é processado, e a
+    memória fica limitada ao tamanho da fila.
+    """
+    fila = queue.Queue(maxsize=tamanho)
+    parar = threading.Event()
+
+    def colocar(item):
+        while not parar.is_set():
+            try:
+                fila.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produzir():
+        try:
+            for item in iteravel:
+                if not colocar(item):
+                    return
+        except BaseException as e:
+            colocar(_Fim(e))
+        else:
+            colocar(_Fim())
+
+    thread = threading.Thread(target=produzir, name='nfce-leitura', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = fila.get()
+            if isinstance(item, _Fim):
+                if item.erro is not None:
+                    raise item.erro
+                return
+            yield item
+    finally:
+        parar.set()
+        thread.join()
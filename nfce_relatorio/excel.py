@@ -0,0 +1,78 @@
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+from .datas import sem_fuso
+from .resumo import calcular_resumo, tabela_resumo
+from .situacao import mascaras
+
+# Linhas de dados por planilha (o limite do Excel é 1.048.576, incluindo o cabeçalho)
+MAX_LINHAS_PLANILHA = 1_048_575
+
+# Linhas usadas para estimar a largura das colunas
+AMOSTRA_LARGURA = 10_000
+
+
+def _larguras(df):
+    """Largura de cada coluna pelo maior texto (cabeçalho ou amostra dos valores), até 50"""
+    amostra = df if len(df) <= AMOSTRA_LARGURA else df.sample(AMOSTRA_LARGURA, random_state=0)
+    larguras = []
+    for col in df.columns:
+        tamanho = amostra[col].astype(str).str.len().max()
+        max_length = max(0 if pd.isna(tamanho) else int(tamanho), len(str(col)))
+        larguras.append(min(max_length + 2, 50))
+    return larguras
+
+
+def _linhas(df):
+    # Uma coluna por vez é convertida em objetos Python, com None no lugar de valores ausentes
+    colunas = []
+    for col in df.columns:
+        valores = df[col].to_numpy(dtype=object, copy=True)
+        valores[pd.isna(valores)] = None
+        colunas.append(valores)
+    return zip(*colunas)
+
+
+def escrever_planilhas(workbook, nome, df):
+    """
+    Escreve df em uma ou mais planilhas em modo streaming: acima de
+    MAX_LINHAS_PLANILHA linhas, os dados continuam em "nome (2)", "nome (3)"...
+    """
+    larguras = _larguras(df)
+    partes = range(0, max(len(df), 1), MAX_LINHAS_PLANILHA)
+    for numero, inicio in enumerate(partes, start=1):
+        worksheet = workbook.create_sheet(nome if numero == 1 else f'{nome} ({numero})')
+        # No modo write-only as larguras precisam ser definidas antes das linhas
+        for idx, largura in enumerate(larguras, start=1):
+            worksheet.column_dimensions[get_column_letter(idx)].width = largura
+        worksheet.append([str(col) for col in df.columns])
+        for linha in _linhas(df.iloc[inicio:inicio + MAX_LINHAS_PLANILHA]):
+            worksheet.append(linha)
+
+
+def gerar_excel(df, output_path, resumo=None):
+    """
+    Gera o relatório Excel com uma planilha para NFCe emitidas, inutilizadas e
+    canceladas e uma planilha "Resumo" por mês e loja (resumo é o
+    calcular_resumo(df, por_loja=True), se já tiver sido calculado).
+    O arquivo é gravado em modo write-only do openpyxl, linha a linha, sem
+    montar a pasta de trabalho inteira em memória.
+    """
+    # O Excel não aceita datas com fuso: vão no horário de São Paulo
+    df = sem_fuso(df)
+
+    # Separar dados em normais, inutilizados e cancelados
+    normais, inutilizadas, canceladas = mascaras(df)
+    df_canceladas_excel = df[canceladas]
+    df_inutilizados_excel = df[inutilizadas]
+    df_normais_excel = df[normais]
+
+    workbook = Workbook(write_only=True)
+    escrever_planilhas(workbook, 'NFCe Emitidas', df_normais_excel)
+    escrever_planilhas(workbook, 'NFCe Inutilizadas', df_inutilizados_excel)
+    escrever_planilhas(workbook, 'NFCe Canceladas', df_canceladas_excel)
+    if resumo is None:
+        resumo = calcular_resumo(df, por_loja=True)
+    escrever_planilhas(workbook, 'Resumo', tabela_resumo(resumo))
+    workbook.save(output_path)
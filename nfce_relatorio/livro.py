@@ -0,0 +1,228 @@
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from . import config
+from .chave import decodificar_chaves
+from .datas import horario_local
+from .parser import VERSAO_PARSER
+from .situacao import (
+    STATUS_EVENTO_CANCELAMENTO,
+    STATUS_NOTA_CANCELADA,
+    como_categoria,
+    eventos_cancelamento,
+    prioridades,
+    situacoes,
+)
+
+# Cache de páginas do SQLite: os índices por data e por emitente recebem
+# inserções fora de ordem, que com o cache padrão (2 MB) vão ao disco a cada linha
+CACHE_SQLITE_KB = 128 * 1024
+
+# Coluna do livro -> coluna do DataFrame das notas
+COLUNAS_LIVRO = {
+    'data': 'Data Emissão',
+    'chave_nota': 'Chave da Nota',
+    'numero': 'Número NFCe',
+    'destinatario': 'Destinatário',
+    'cpf_cnpj': 'CPF/CNPJ Destinatário',
+    'valor': 'Valor Total',
+    'status': 'Status',
+    'protocolo': 'Protocolo',
+    'justificativa': 'Justificativa',
+    'situacao': 'Situação',
+}
+
+# Dados da nota (data, valor, destinatário...): vêm do registro mais recente,
+# a menos que a nota já esteja no livro e o novo registro seja só o evento de
+# cancelamento dela ou tenha prioridade menor
+_DADOS_NOTA = ['data', 'chave_nota', 'numero', 'destinatario', 'cpf_cnpj', 'valor', 'protocolo', 'cnpj']
+
+# Situação da nota: vem do registro de maior prioridade (empate: o mais recente)
+_SITUACAO_NOTA = ['status', 'justificativa', 'situacao', 'prioridade']
+
+_UPSERT = (
+    'INSERT INTO notas (chave, cnpj, ' + ', '.join(COLUNAS_LIVRO) + ', prioridade, evento, atualizado)'
+    ' VALUES (' + ', '.join(['?'] * (len(COLUNAS_LIVRO) + 5)) + ')'
+    ' ON CONFLICT (chave) DO UPDATE SET '
+    + ', '.join(
+        f'{coluna} = CASE WHEN NOT notas.evento AND (excluded.evento OR excluded.prioridade < notas.prioridade)'
+        f' THEN notas.{coluna} ELSE excluded.{coluna} END'
+        for coluna in _DADOS_NOTA
+    )
+    + ', '
+    + ', '.join(
+        f'{coluna} = CASE WHEN excluded.prioridade < notas.prioridade THEN notas.{coluna} ELSE excluded.{coluna} END'
+        for coluna in _SITUACAO_NOTA
+    )
+    + ', evento = notas.evento AND excluded.evento, atualizado = excluded.atualizado'
+)
+
+
+def _texto(valores):
+    # Textos do DataFrame como objetos Python, com None no lugar de valores ausentes
+    valores = valores.to_numpy(dtype=object, copy=True)
+    valores[pd.isna(valores)] = None
+    return valores
+
+
+class LivroNotas:
+    """
+    Livro persistente (SQLite) das notas de todos os envios, uma linha por
+    chave de acesso: um cancelamento recebido depois atualiza a nota
+    autorizada em vez de acrescentar outra linha. Também guarda o SHA-256 dos
+    arquivos já lidos, para que cada envio só processe os arquivos novos.
+    """
+
+    def __init__(self, caminho):
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self.caminho = caminho
+        self._conexao = sqlite3.connect(caminho, timeout=30)
+        self._conexao.execute('PRAGMA journal_mode=WAL')
+        self._conexao.execute('PRAGMA synchronous=NORMAL')
+        self._conexao.execute(f'PRAGMA cache_size=-{CACHE_SQLITE_KB}')
+        self._conexao.execute(
+            'CREATE TABLE IF NOT EXISTS notas ('
+            ' chave TEXT PRIMARY KEY,'
+            ' cnpj TEXT,'
+            ' data TEXT,'
+            ' chave_nota TEXT,'
+            ' numero TEXT,'
+            ' destinatario TEXT,'
+            ' cpf_cnpj TEXT,'
+            ' valor REAL,'
+            ' status TEXT,'
+            ' protocolo TEXT,'
+            ' justificativa TEXT,'
+            ' situacao TEXT,'
+            ' prioridade INTEGER NOT NULL,'
+            ' evento INTEGER NOT NULL,'
+            ' atualizado REAL NOT NULL)'
+        )
+        # Consultas por período e por emitente + período
+        self._conexao.execute('CREATE INDEX IF NOT EXISTS idx_notas_data ON notas (data)')
+        self._conexao.execute('CREATE INDEX IF NOT EXISTS idx_notas_cnpj_data ON notas (cnpj, data)')
+        self._conexao.execute(
+            'CREATE TABLE IF NOT EXISTS arquivos ('
+            ' sha256 TEXT PRIMARY KEY,'
+            ' versao TEXT NOT NULL,'
+            ' lido REAL NOT NULL)'
+        )
+        self._conexao.commit()
+
+    def arquivo_lido(self, sha256):
+        """Indica se o arquivo com este SHA-256 já foi lido pela versão atual do parser"""
+        linha = self._conexao.execute(
+            'SELECT 1 FROM arquivos WHERE sha256 = ? AND versao = ?', (sha256, VERSAO_PARSER)
+        ).fetchone()
+        return linha is not None
+
+    def registrar(self, df, hashes=()):
+        """
+        Grava as notas de df (formato de montar_dataframe) e marca os arquivos
+        de hashes como lidos, em uma única transação. Notas sem chave de
+        acesso (inutilizações) são identificadas pela faixa, protocolo e data.
+        Retorna o número de linhas gravadas.
+        """
+        agora = time.time()
+        vazio = df is None or df.empty
+        linhas = [] if vazio else self._linhas(df, agora)
+        with self._conexao:
+            self._conexao.executemany(_UPSERT, linhas)
+            self._conexao.executemany(
+                'INSERT OR REPLACE INTO arquivos (sha256, versao, lido) VALUES (?, ?, ?)',
+                [(sha256, VERSAO_PARSER, agora) for sha256 in hashes]
+            )
+        return 0 if vazio else len(df)
+
+    def _linhas(self, df, agora):
+        validas = decodificar_chaves(df['Chave da Nota'])
+        cnpjs = _texto(validas['CNPJ'])
+        datas = horario_local(pd.Series(pd.to_datetime(df['Data Emissão'], errors='coerce'), index=df.index))
+        textos_data = _texto(datas.dt.strftime('%Y-%m-%d %H:%M:%S'))
+        colunas = {
+            coluna: _texto(df[nome].astype(object)) for coluna, nome in COLUNAS_LIVRO.items() if coluna != 'data'
+        }
+        colunas['data'] = textos_data
+        colunas['valor'] = pd.to_numeric(df['Valor Total'], errors='coerce').astype(float).tolist()
+        colunas['situacao'] = _texto(situacoes(df).astype(object))
+
+        chaves = _texto(df['Chave da Nota'].astype(object))
+        sem_chave = validas['CNPJ'].isna().to_numpy()
+        if sem_chave.any():
+            # Sem chave de acesso: a faixa sozinha não é única entre emitentes
+            extras = pd.Series(colunas['protocolo'][sem_chave]).fillna('').astype(str) + '|' + \
+                pd.Series(textos_data[sem_chave]).fillna('').astype(str)
+            chaves[sem_chave] = (pd.Series(chaves[sem_chave]).fillna('').astype(str) + '|' + extras).to_numpy()
+        eventos = eventos_cancelamento(df).astype(np.int64).tolist()
+
+        return zip(
+            chaves, cnpjs, *(colunas[coluna] for coluna in COLUNAS_LIVRO), prioridades(df).tolist(), eventos,
+            [agora] * len(df)
+        )
+
+    def ler(self, inicio=None, fim=None, cnpjs=None):
+        """
+        Notas do livro dos meses de inicio a fim ('AAAA-MM', inclusive) e dos
+        CNPJs indicados (todos, se None), com as colunas de montar_dataframe.
+        Notas sem data só entram quando o período não é limitado.
+        """
+        condicoes, parametros = [], []
+        if inicio is not None:
+            condicoes.append('data >= ?')
+            parametros.append(pd.Period(inicio, 'M').start_time.strftime('%Y-%m-%d'))
+        if fim is not None:
+            condicoes.append('data < ?')
+            parametros.append((pd.Period(fim, 'M') + 1).start_time.strftime('%Y-%m-%d'))
+        if cnpjs:
+            condicoes.append(f"cnpj IN ({', '.join(['?'] * len(cnpjs))})")
+            parametros.extend(str(cnpj) for cnpj in cnpjs)
+        # Nota que recebeu o evento de cancelamento: sai com o status da nota
+        # cancelada, e não com o do evento (como em conciliacao.conciliar)
+        selecao = [
+            'CASE WHEN status = ? AND NOT evento THEN ? ELSE status END' if coluna == 'status' else coluna
+            for coluna in COLUNAS_LIVRO
+        ]
+        parametros = [STATUS_EVENTO_CANCELAMENTO, STATUS_NOTA_CANCELADA] + parametros
+        consulta = 'SELECT ' + ', '.join(selecao) + ' FROM notas'
+        if condicoes:
+            consulta += ' WHERE ' + ' AND '.join(condicoes)
+        df = pd.read_sql_query(consulta, self._conexao, params=parametros)
+        df.columns = list(COLUNAS_LIVRO.values())
+        df['Situação'] = como_categoria(df['Situação'])
+        df['Valor Total'] = df['Valor Total'].astype(float)
+        return df
+
+    def meses(self):
+        """Meses ('AAAA-MM') com notas no livro, em ordem"""
+        cursor = self._conexao.execute(
+            'SELECT DISTINCT substr(data, 1, 7) FROM notas WHERE data IS NOT NULL ORDER BY 1'
+        )
+        return [mes for (mes,) in cursor]
+
+    def cnpjs(self):
+        """CNPJs de emitentes com notas no livro, em ordem"""
+        cursor = self._conexao.execute('SELECT DISTINCT cnpj FROM notas WHERE cnpj IS NOT NULL ORDER BY 1')
+        return [cnpj for (cnpj,) in cursor]
+
+    def __len__(self):
+        return self._conexao.execute('SELECT COUNT(*) FROM notas').fetchone()[0]
+
+    def fechar(self):
+        self._conexao.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+def abrir_livro(caminho=None):
+    """Abre o livro configurado (NFCE_LIVRO)"""
+    return LivroNotas(config.LIVRO_PATH if caminho is None else caminho)
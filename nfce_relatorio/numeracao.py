@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+
+from .chave import decodificar_chaves, formatar_cnpj
+from .situacao import mascaras
+
+
+def numeros_inteiros(valores):
+    """
+    Converte os números de NFCe (texto, com ou sem zeros à esquerda) em uma
+    série Int64 alinhada à entrada; valores vazios ou não inteiros ficam nulos.
+    """
+    textos = pd.Series(valores).astype(str).str.strip()
+    validos = textos.str.fullmatch(r'\d{1,18}').to_numpy(dtype=bool)
+    numeros = pd.Series(pd.NA, index=textos.index, dtype='Int64')
+    numeros[validos] = textos[validos].astype(np.int64)
+    return numeros
+
+
+def intervalos_pulados(numeros):
+    """
+    Retorna os intervalos (inicio, fim) de números ausentes entre o menor e o
+    maior número informado. Os números pulados nunca são gerados um a um.
+    Exemplo: [1, 2, 3, 10, 12] -> [(4, 9), (11, 11)]
+    """
+    # Repetições geram diferença 0 e não afetam o resultado
+    numeros = np.sort(np.asarray(numeros, dtype=np.int64))
+    if len(numeros) < 2:
+        return []
+    saltos = np.flatnonzero(np.diff(numeros) > 1)
+    inicios = numeros[saltos] + 1
+    fins = numeros[saltos + 1] - 1
+    return list(zip(inicios.tolist(), fins.tolist()))
+
+
+def total_pulados(intervalos):
+    """
+    Quantidade de números contidos nos intervalos (inicio, fim), informados em
+    lista ou no dicionário por grupo de detectar_numeracoes_puladas
+    """
+    if isinstance(intervalos, dict):
+        return sum(total_pulados(lista) for lista in intervalos.values())
+    return sum(fim - inicio + 1 for inicio, fim in intervalos)
+
+
+def intervalos_por_grupo(grupos, numeros):
+    """
+    Versão de intervalos_pulados que considera cada grupo separadamente, em uma
+    única passagem vetorizada. grupos é um array de códigos inteiros alinhado a
+    numeros. Retorna {grupo: [(inicio, fim), ...]} apenas para os grupos com saltos.
+    """
+    grupos = np.asarray(grupos, dtype=np.int64)
+    numeros = np.asarray(numeros, dtype=np.int64)
+    # Ordena por grupo e, dentro do grupo, por número
+    ordem = np.lexsort((numeros, grupos))
+    grupos = grupos[ordem]
+    numeros = numeros[ordem]
+    saltos = np.flatnonzero((np.diff(numeros) > 1) & (grupos[1:] == grupos[:-1]))
+    intervalos = {}
+    for grupo, inicio, fim in zip(grupos[saltos].tolist(), (numeros[saltos] + 1).tolist(),
+                                  (numeros[saltos + 1] - 1).tolist()):
+        intervalos.setdefault(grupo, []).append((inicio, fim))
+    return intervalos
+
+
+# Função para detectar numerações descontínuas
+def detectar_numeracoes_puladas(df, chaves=None):
+    """
+    Detecta numerações descontínuas nas NFCe. Notas canceladas contam como
+    numeração usada; inutilizações ficam de fora. A numeração é verificada
+    separadamente para cada CNPJ emitente, modelo e série (extraídos da chave
+    de acesso); notas sem chave válida formam o grupo None.
+    chaves, se informado, é o resultado de chave.decodificar_chaves(df['Chave da Nota']).
+    Retorna {(cnpj, modelo, serie): [(inicio, fim), ...]} com os intervalos pulados.
+    """
+    # Cancelar uma nota não libera o número dela: só as inutilizações ficam de fora
+    usadas = ~mascaras(df)[1]
+    if chaves is None:
+        if 'Chave da Nota' in df.columns:
+            chaves = decodificar_chaves(df['Chave da Nota'])
+        else:
+            chaves = decodificar_chaves(pd.Series(pd.NA, index=df.index))
+    # O número vem da chave de acesso; sem chave, da coluna Número NFCe
+    numeros = chaves['nNF'].copy()
+    sem_chave = numeros.isna().to_numpy(dtype=bool)
+    if sem_chave.any():
+        numeros[sem_chave] = numeros_inteiros(df['Número NFCe'][sem_chave])
+    selecionados = usadas & numeros.notna().to_numpy(dtype=bool)
+    grupos = chaves.loc[selecionados, ['CNPJ', 'mod', 'serie']]
+    codigos = grupos.groupby(['CNPJ', 'mod', 'serie'], dropna=False, sort=True).ngroup().to_numpy()
+    intervalos = intervalos_por_grupo(codigos, numeros[selecionados].to_numpy(dtype=np.int64))
+    if not intervalos:
+        return {}
+
+    # Traduz os códigos de grupo em (cnpj, modelo, serie), na ordem dos grupos
+    representantes = grupos.assign(codigo=codigos).drop_duplicates('codigo').set_index('codigo')
+    resultado = {}
+    for codigo in sorted(intervalos):
+        cnpj, modelo, serie = representantes.loc[codigo, ['CNPJ', 'mod', 'serie']]
+        grupo = None if pd.isna(cnpj) else (cnpj, int(modelo), int(serie))
+        resultado[grupo] = intervalos[codigo]
+    return resultado
+
+
+def descrever_grupo(grupo):
+    """Texto que identifica um grupo de numeração nos relatórios"""
+    if grupo is None:
+        return "Notas sem chave de acesso"
+    cnpj, modelo, serie = grupo
+    return f"CNPJ {formatar_cnpj(cnpj)} - Modelo {modelo} - Série {serie}"
+
+
+def formatar_intervalos(intervalos):
+    """
+    Converte intervalos (inicio, fim) em texto.
+    Exemplo: [(2, 9), (11, 11)] -> ['2 até 9', '11']
+    """
+    return [f"{inicio}" if inicio == fim else f"{inicio} até {fim}" for inicio, fim in intervalos]
+
+
+def agrupar_em_intervalos(numeros):
+    """
+    Recebe uma lista de inteiros e retorna uma lista de strings com intervalos agrupados.
+    Exemplo: [2,3,4,5,6,7,8,9] -> ['2 até 9']
+    """
+    numeros = np.sort(np.asarray(numeros, dtype=np.int64))
+    if not len(numeros):
+        return []
+    numeros = numeros[np.concatenate(([True], np.diff(numeros) != 0))]
+    quebras = np.flatnonzero(np.diff(numeros) != 1)
+    inicios = numeros[np.concatenate(([0], quebras + 1))]
+    fins = numeros[np.concatenate((quebras, [len(numeros) - 1]))]
+    return formatar_intervalos(zip(inicios.tolist(), fins.tolist()))
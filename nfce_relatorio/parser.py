@@ -0,0 +1,460 @@
+import codecs
+import logging
+import re
+import xml.parsers.expat
+
+from .situacao import CANCELADA, INUTILIZADA, SEM_PROTOCOLO, STATUS_EVENTO_CANCELAMENTO, situacao_por_cstat
+
+logger = logging.getLogger(__name__)
+
+# Versão do formato dos registros; altere sempre que a extração mudar para
+# invalidar o cache persistente (cache.CacheRegistros)
+VERSAO_PARSER = '5'
+
+
+class NFCeInvalidaError(ValueError):
+    """Arquivo que não pôde ser interpretado como NFCe, inutilização ou evento"""
+
+
+# Marca uma subárvore que deve ser mantida inteira
+_TUDO = object()
+
+# Campos de texto (folhas) também são mantidos inteiros
+_FOLHA = _TUDO
+
+# Campos de uma NFe usados por enviNFe e nfeProc
+_CAMPOS_NFE = {
+    'infnfe': {
+        'ide': {'dhemi': _FOLHA, 'nnf': _FOLHA},
+        # O destinatário é mantido inteiro: um <dest> sem xNome ainda conta como preenchido
+        'dest': _TUDO,
+        'total': {'icmstot': {'vnf': _FOLHA}},
+    },
+}
+
+_CAMPOS_EVENTO = {
+    'infevento': {
+        'tpevento': _FOLHA,
+        'chnfe': _FOLHA,
+        'dhevento': _FOLHA,
+        'detevento': {'xjust': _FOLHA, 'nprot': _FOLHA},
+    },
+}
+
+_CAMPOS_INUT = {
+    'infinut': {
+        'nnfini': _FOLHA,
+        'nnffin': _FOLHA,
+        'xjust': _FOLHA,
+        'dhrecbto': _FOLHA,
+        'xmotivo': _FOLHA,
+        'nprot': _FOLHA,
+        'cstat': _FOLHA,
+    },
+}
+
+# Caminhos lidos de cada tipo de documento, pelo nome local (minúsculo) do elemento raiz.
+# Todo o resto (itens <det>, <pag>, <infAdic>, assinatura...) é descartado durante a leitura.
+CAMPOS_POR_RAIZ = {
+    'procinutnfe': {'inutnfe': _CAMPOS_INUT, 'retinutnfe': _CAMPOS_INUT},
+    'inutnfe': _CAMPOS_INUT,
+    'envevento': {'evento': _CAMPOS_EVENTO},
+    'proceventonfe': {'evento': _CAMPOS_EVENTO, 'retevento': {'infevento': {'nprot': _FOLHA}}},
+    'envinfe': {'nfe': _CAMPOS_NFE},
+    'nfeproc': {
+        'nfe': _CAMPOS_NFE,
+        'protnfe': {'infprot': {'chnfe': _FOLHA, 'xmotivo': _FOLHA, 'nprot': _FOLHA, 'cstat': _FOLHA}},
+    },
+}
+
+
+def _acrescentar(item, chave, valor):
+    # Mesma regra do xmltodict: chaves repetidas viram lista
+    if item is None:
+        item = {}
+    if chave in item:
+        atual = item[chave]
+        if isinstance(atual, list):
+            atual.append(valor)
+        else:
+            item[chave] = [atual, valor]
+    else:
+        item[chave] = valor
+    return item
+
+
+class _ExtratorParcial:
+    """
+    Handler expat que monta o mesmo dicionário que xmltodict.parse, porém
+    apenas com os caminhos listados em CAMPOS_POR_RAIZ.
+
+    Ao entrar em uma subárvore não utilizada os handlers do parser são
+    trocados por versões que só contam a profundidade, e o texto deixa de
+    ser entregue ao Python até o fim da subárvore.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.pilha = []
+        self.item = None
+        self.dados = []
+        self.dados_append = self.dados.append
+        self.campos = None
+        self.ignorando = 0
+        self.ativar()
+
+    def ativar(self):
+        self.parser.StartElementHandler = self.inicio
+        self.parser.EndElementHandler = self.fim
+        self.parser.CharacterDataHandler = self.dados_append
+
+    def inicio(self, nome, atributos):
+        local = nome.rsplit(':', 1)[-1].lower()
+        if not self.pilha:
+            campos = CAMPOS_POR_RAIZ.get(local, {})
+        elif self.campos is _TUDO:
+            campos = _TUDO
+        else:
+            campos = self.campos.get(local)
+            if campos is None:
+                # Subárvore não utilizada: o elemento pai continua sendo um dicionário,
+                # como seria com a subárvore completa
+                if self.item is None:
+                    self.item = {}
+                self.ignorando = 1
+                self.parser.StartElementHandler = self.inicio_ignorado
+                self.parser.EndElementHandler = self.fim_ignorado
+                self.parser.CharacterDataHandler = _descartar
+                return
+        self.pilha.append((self.item, self.dados, self.campos))
+        self.item = {'@' + chave: valor for chave, valor in atributos.items()} or None
+        self.dados = []
+        self.dados_append = self.dados.append
+        self.parser.CharacterDataHandler = self.dados_append
+        self.campos = campos
+
+    def fim(self, nome):
+        dados = ''.join(self.dados).strip() or None if self.dados else None
+        item = self.item
+        self.item, self.dados, self.campos = self.pilha.pop()
+        self.dados_append = self.dados.append
+        self.parser.CharacterDataHandler = self.dados_append
+        if item is not None:
+            if dados:
+                _acrescentar(item, '#text', dados)
+            self.item = _acrescentar(self.item, nome, item)
+        else:
+            self.item = _acrescentar(self.item, nome, dados)
+
+    def inicio_ignorado(self, nome, atributos):
+        self.ignorando += 1
+
+    def fim_ignorado(self, nome):
+        self.ignorando -= 1
+        if not self.ignorando:
+            self.ativar()
+
+
+def _descartar(dados):
+    pass
+
+
+def parse_parcial(xml_content):
+    """
+    Lê o XML com expat extraindo apenas os campos usados nos relatórios.
+    O resultado tem o mesmo formato de xmltodict.parse (sem as subárvores
+    descartadas). Levanta xml.parsers.expat.ExpatError para XML inválido.
+    Bytes são lidos como estão, na codificação da declaração <?xml?> (UTF-8
+    se não houver); texto é lido como UTF-8, ignorando a declaração.
+    """
+    if isinstance(xml_content, str):
+        xml_content = xml_content.encode('utf-8')
+        parser = xml.parsers.expat.ParserCreate('utf-8')
+    else:
+        parser = xml.parsers.expat.ParserCreate()
+    parser.buffer_text = True
+    # Entidades não são expandidas, como no xmltodict
+    parser.DefaultHandler = _descartar
+    parser.ExternalEntityRefHandler = lambda *args: 1
+    extrator = _ExtratorParcial(parser)
+    parser.Parse(xml_content, True)
+    return extrator.item
+
+
+# Função auxiliar para buscar uma chave ignorando namespace
+def find_key_ignore_ns(d, key):
+    for k in d.keys():
+        # Atributos (como @xmlns:nfe) não são elementos
+        if k.startswith('@'):
+            continue
+        if k.split(':')[-1].lower() == key.lower() or k.split('}')[-1].lower() == key.lower():
+            return k
+    return None
+
+
+_DECLARACAO_ENCODING = re.compile(rb'\s*<\?xml[^>]*?encoding\s*=\s*["\']([A-Za-z][A-Za-z0-9._-]*)["\']')
+
+
+def _erro_codificacao(xml_content):
+    """
+    Descreve os bytes de xml_content que não valem na codificação declarada
+    (ou em UTF-8, sem declaração), ou retorna None se não há nenhum
+    """
+    if not isinstance(xml_content, bytes) or xml_content.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return None
+    declaracao = _DECLARACAO_ENCODING.match(xml_content[:200])
+    codificacao = declaracao.group(1).decode('ascii') if declaracao else 'UTF-8'
+    try:
+        codecs.decode(xml_content, codificacao)
+    except LookupError:
+        return f"codificação desconhecida: {codificacao}"
+    except UnicodeDecodeError as e:
+        return f"bytes inválidos para a codificação {codificacao} na posição {e.start}: {xml_content[e.start:e.end]!r}"
+    return None
+
+
+def extrair_registros(xml_content, filename):
+    """
+    Extrai o registro (ou a lista de registros) de um XML de NFCe.
+    O conteúdo em bytes vai direto ao expat, que respeita a codificação
+    declarada (ISO-8859-1 de emissores antigos, por exemplo); bytes inválidos
+    nessa codificação tornam o arquivo inválido, em vez de serem descartados.
+    Levanta NFCeInvalidaError quando o arquivo não é um documento reconhecido.
+    """
+    try:
+        xml_dict = parse_parcial(xml_content)
+    except xml.parsers.expat.ExpatError as e:
+        # O expat só informa "invalid token": a mensagem diz qual byte não vale na codificação
+        motivo = _erro_codificacao(xml_content) or str(e)
+        raise NFCeInvalidaError(f"Arquivo {filename} está corrompido ou não é um XML válido: {motivo}") from e
+    except LookupError as e:
+        # Codificação declarada que o Python não conhece
+        raise NFCeInvalidaError(f"Arquivo {filename} não pôde ser lido: {str(e)}") from e
+    return registros_de_dict(xml_dict, filename)
+
+
+def registros_de_dict(xml_dict, filename):
+    """
+    Monta os registros a partir do dicionário do documento (formato xmltodict).
+    As datas ficam no texto ISO 8601 do XML; montar_dataframe converte todas
+    de uma vez (datas.converter_datas).
+    """
+    # Verifica se é um arquivo de inutilização
+    proc_inut_key = find_key_ignore_ns(xml_dict, 'ProcInutNFe')
+    if proc_inut_key:
+        inutil = xml_dict[proc_inut_key].get('inutNFe', {})
+        inf_inut = inutil.get('infInut', {})
+        ret_inut = xml_dict[proc_inut_key].get('retInutNFe', {}).get('infInut', {})
+
+        # Número inicial e final
+        nNFIni = inf_inut.get('nNFIni', '')
+        nNFFin = inf_inut.get('nNFFin', '')
+        faixa = f"{nNFIni} - {nNFFin}" if nNFIni != nNFFin else nNFIni
+
+        # Data do evento
+        data_emissao = ret_inut.get('dhRecbto', '')
+
+        # Justificativa da inutilização
+        justificativa = inf_inut.get('xJust', '')
+
+        # Status e protocolo
+        status = ret_inut.get('xMotivo', 'INUTILIZADO')
+        protocolo = ret_inut.get('nProt', '')
+        situacao = situacao_por_cstat(ret_inut.get('cStat'), INUTILIZADA)
+
+        return {
+            'Data Emissão': data_emissao,
+            'Chave da Nota': faixa,
+            'Número NFCe': nNFIni,
+            'Destinatário': 'Não se aplica',
+            'CPF/CNPJ Destinatário': 'Não se aplica',
+            'Valor Total': 0.0,
+            'Status': status,
+            'Protocolo': protocolo,
+            'Justificativa': justificativa,
+            'Situação': situacao
+        }
+
+    # Verifica se é um envelope de eventos (envEvento)
+    env_evento_key = find_key_ignore_ns(xml_dict, 'envEvento')
+    if env_evento_key:
+        eventos = xml_dict[env_evento_key].get('evento', [])
+        # Garante que eventos seja uma lista
+        if not isinstance(eventos, list):
+            eventos = [eventos]
+        resultados = []
+        for evento in eventos:
+            inf_evento = evento.get('infEvento', {})
+            tp_evento = str(inf_evento.get('tpEvento', '')).strip()
+            if tp_evento in ['110111', '110112']:
+                chNFe = inf_evento.get('chNFe', '')
+                data_emissao = inf_evento.get('dhEvento', '')
+                justificativa = inf_evento.get('detEvento', {}).get('xJust', '')
+                protocolo = inf_evento.get('detEvento', {}).get('nProt', '')
+                status = STATUS_EVENTO_CANCELAMENTO
+                nNF = 'Não identificado'
+                if len(chNFe) == 44:
+                    try:
+                        nNF = chNFe[25:34]
+                    except Exception:
+                        nNF = 'Não identificado'
+                resultados.append({
+                    'Data Emissão': data_emissao,
+                    'Chave da Nota': chNFe,
+                    'Número NFCe': nNF,
+                    'Destinatário': 'Não se aplica',
+                    'CPF/CNPJ Destinatário': 'Não se aplica',
+                    'Valor Total': 0.0,
+                    'Status': status,
+                    'Protocolo': protocolo,
+                    'Justificativa': justificativa,
+                    'Situação': CANCELADA
+                })
+        if resultados:
+            return resultados
+
+    # Verifica se é um inutilizado simples (inutNFe)
+    inutnfe_key = find_key_ignore_ns(xml_dict, 'inutNFe')
+    if inutnfe_key:
+        inutil = xml_dict[inutnfe_key]
+        inf_inut = inutil.get('infInut', {})
+        nNFIni = inf_inut.get('nNFIni', '')
+        nNFFin = inf_inut.get('nNFFin', '')
+        faixa = f"{nNFIni} - {nNFFin}" if nNFIni != nNFFin else nNFIni
+        data_emissao = inf_inut.get('dhRecbto', '')
+        justificativa = inf_inut.get('xJust', '')
+        status = 'INUTILIZADO'
+        protocolo = ''
+        return {
+            'Data Emissão': data_emissao,
+            'Chave da Nota': faixa,
+            'Número NFCe': nNFIni,
+            'Destinatário': 'Não se aplica',
+            'CPF/CNPJ Destinatário': 'Não se aplica',
+            'Valor Total': 0.0,
+            'Status': status,
+            'Protocolo': protocolo,
+            'Justificativa': justificativa,
+            'Situação': INUTILIZADA
+        }
+
+    # Verifica se é um envelope de envio (enviNFe)
+    envinfe_key = find_key_ignore_ns(xml_dict, 'enviNFe')
+    if envinfe_key:
+        nfes = xml_dict[envinfe_key].get('NFe', [])
+        if not isinstance(nfes, list):
+            nfes = [nfes]
+        resultados = []
+        for nfe in nfes:
+            infNFe = nfe.get('infNFe', {})
+            ide = infNFe.get('ide', {}) if isinstance(infNFe.get('ide', {}), dict) else {}
+            data_emissao = ide.get('dhEmi', '')
+            chNFe = infNFe.get('@Id', '').replace('NFe', '') if infNFe.get('@Id', '') else ''
+            destinatario = infNFe.get('dest', {}) if isinstance(infNFe.get('dest', {}), dict) else {}
+            total = infNFe.get('total', {}) if isinstance(infNFe.get('total', {}), dict) else {}
+            icms_tot = total.get('ICMSTot', {}) if isinstance(total.get('ICMSTot', {}), dict) else {}
+            vnf = icms_tot.get('vNF', 0)
+            try:
+                valor_total = float(vnf)
+            except Exception:
+                valor_total = 0.0
+            return_dict = {
+                'Data Emissão': data_emissao,
+                'Chave da Nota': chNFe,
+                'Número NFCe': ide.get('nNF', ''),
+                'Destinatário': destinatario.get('xNome', '') if destinatario else 'Consumidor não identificado',
+                'CPF/CNPJ Destinatário': destinatario.get('CPF', '') or destinatario.get('CNPJ', '') or 'Não informado',
+                'Valor Total': valor_total,
+                'Status': 'ENVIADO (SEM PROTOCOLO)',
+                'Protocolo': '',
+                'Justificativa': '',
+                'Situação': SEM_PROTOCOLO
+            }
+            resultados.append(return_dict)
+        if resultados:
+            return resultados
+
+    # Verifica se é um evento processado (procEventoNFe)
+    proc_evento_key = find_key_ignore_ns(xml_dict, 'procEventoNFe')
+    if proc_evento_key:
+        proc_evento = xml_dict[proc_evento_key]
+        evento = proc_evento.get('evento', {})
+        inf_evento = evento.get('infEvento', {})
+        tp_evento = str(inf_evento.get('tpEvento', '')).strip()
+        if tp_evento == '110111':  # Cancelamento
+            chNFe = inf_evento.get('chNFe', '')
+            data_emissao = inf_evento.get('dhEvento', '')
+            justificativa = inf_evento.get('detEvento', {}).get('xJust', '')
+            protocolo = inf_evento.get('detEvento', {}).get('nProt', '') or proc_evento.get('retEvento', {}).get('infEvento', {}).get('nProt', '')
+            status = STATUS_EVENTO_CANCELAMENTO
+            nNF = 'Não identificado'
+            if len(chNFe) == 44:
+                try:
+                    nNF = chNFe[25:34]
+                except Exception:
+                    nNF = 'Não identificado'
+            return {
+                'Data Emissão': data_emissao,
+                'Chave da Nota': chNFe,
+                'Número NFCe': nNF,
+                'Destinatário': 'Não se aplica',
+                'CPF/CNPJ Destinatário': 'Não se aplica',
+                'Valor Total': 0.0,
+                'Status': status,
+                'Protocolo': protocolo,
+                'Justificativa': justificativa,
+                'Situação': CANCELADA
+            }
+
+    # Processamento de NFCe normal
+    nfeproc_key = find_key_ignore_ns(xml_dict, 'nfeProc')
+    if not nfeproc_key:
+        raise NFCeInvalidaError(f"Arquivo {filename} não contém informações de NFCe válidas")
+    nfeproc = xml_dict[nfeproc_key]
+    nfe_key = find_key_ignore_ns(nfeproc, 'NFe')
+    if not nfe_key:
+        raise NFCeInvalidaError(f"Arquivo {filename} não contém informações de NFCe válidas")
+    nfce = nfeproc[nfe_key]
+    infNFe_key = find_key_ignore_ns(nfce, 'infNFe')
+    if not infNFe_key:
+        raise NFCeInvalidaError(f"Arquivo {filename} não contém informações de NFCe válidas")
+    infNFe = nfce[infNFe_key]
+    data_emissao = infNFe.get('ide', {}).get('dhEmi', '')
+    protNFe_key = find_key_ignore_ns(nfeproc, 'protNFe')
+    prot = nfeproc.get(protNFe_key, {}).get('infProt', {}) if protNFe_key else {}
+    destinatario = infNFe.get('dest', {})
+    total = infNFe.get('total', {}).get('ICMSTot', {})
+    return {
+        'Data Emissão': data_emissao,
+        'Chave da Nota': prot.get('chNFe', ''),
+        'Número NFCe': infNFe.get('ide', {}).get('nNF', ''),
+        'Destinatário': destinatario.get('xNome', '') if destinatario else 'Consumidor não identificado',
+        'CPF/CNPJ Destinatário': destinatario.get('CPF', '') or destinatario.get('CNPJ', '') or 'Não informado',
+        'Valor Total': float(total.get('vNF', 0)),
+        'Status': prot.get('xMotivo', ''),
+        'Protocolo': prot.get('nProt', ''),
+        'Justificativa': '',
+        'Situação': situacao_por_cstat(prot.get('cStat'))
+    }
+
+
+def analisar_xml(xml_content, filename):
+    """
+    Versão de extrair_registros que nunca levanta exceção.
+    Retorna (resultado, mensagem_de_erro); apenas um dos dois é preenchido.
+    """
+    try:
+        return extrair_registros(xml_content, filename), None
+    except NFCeInvalidaError as e:
+        return None, str(e)
+    except Exception as e:
+        logger.debug("Falha ao processar %s", filename, exc_info=True)
+        return None, f"Erro ao processar arquivo {filename}: {str(e)}"
+
+
+# Função para processar arquivo XML
+def process_xml_file(xml_content, filename):
+    resultado, erro = analisar_xml(xml_content, filename)
+    if erro:
+        logger.warning(erro)
+    return resultado
@@ -0,0 +1,451 @@
+import io
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from . import config
+from .acervo import gravar_acervo, ler_acervo
+from .cache import hash_conteudo
+from .chave import chaves_para_ordenacao
+from .colunas import ColunasRegistros
+from .conciliacao import conciliar
+from .datas import converter_datas
+from .desempenho import etapa
+from .excel import gerar_excel
+from .numeracao import detectar_numeracoes_puladas, numeros_inteiros
+from .parser import analisar_xml
+from .relatorios import generate_pdf, generate_pdf_resumido, generate_pdf_numeros_pulados
+from .situacao import como_categoria
+
+logger = logging.getLogger(__name__)
+
+
+class ResultadoProcessamento:
+    """Registros extraídos de um lote de XML (em colunas) e os arquivos que falharam"""
+
+    def __init__(self):
+        self.registros = ColunasRegistros()
+        self.arquivos_nao_processados = []
+        # Posições, na ordem de leitura, dos arquivos de arquivos_nao_processados
+        self.indices_nao_processados = []
+        self.erros = []
+        self.total_itens_processados = 0
+        # ResultadoConciliacao das notas, preenchido por executar
+        self.conciliacao = None
+
+
+# Abaixo deste número de arquivos a leitura é sequencial: iniciar os processos
+# custaria mais do que o paralelismo economiza
+LIMIAR_PARALELO = 2000
+
+# Arquivos enviados a cada processo por vez
+TAMANHO_LOTE = 250
+
+
+def _analisar_lote(lote):
+    # Resultados do lote e os tempos de relógio e de CPU gastos nele
+    relogio, cpu = time.perf_counter(), time.thread_time()
+    resultados = [analisar_xml(xml_content, nome_arquivo) for xml_content, nome_arquivo in lote]
+    return resultados, time.perf_counter() - relogio, time.thread_time() - cpu
+
+
+def _analisar_sequencial(arquivos, desempenho=None):
+    for xml_content, nome_arquivo in arquivos:
+        if desempenho is None:
+            registros, erro = analisar_xml(xml_content, nome_arquivo)
+        else:
+            relogio, cpu = time.perf_counter(), time.thread_time()
+            registros, erro = analisar_xml(xml_content, nome_arquivo)
+            desempenho.acumular('analise_xml', time.perf_counter() - relogio, time.thread_time() - cpu)
+        yield nome_arquivo, registros, erro
+
+
+def _analisar_paralelo(arquivos, workers, desempenho=None):
+    # Mantém no máximo 2 lotes por processo em andamento, para que a memória
+    # não cresça com o tamanho do arquivo ZIP
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as executor:
+        pendentes = deque()
+        arquivos = iter(arquivos)
+        while True:
+            while len(pendentes) < workers * 2:
+                lote = list(islice(arquivos, TAMANHO_LOTE))
+                if not lote:
+                    break
+                try:
+                    futuro = executor.submit(_analisar_lote, lote)
+                except BrokenProcessPool:
+                    futuro = None
+                pendentes.append((lote, futuro))
+            if not pendentes:
+                return
+            lote, futuro = pendentes.popleft()
+            try:
+                analisado = futuro.result() if futuro else None
+            except BrokenProcessPool:
+                analisado = None
+            if analisado is None:
+                # Um processo do pool terminou de forma inesperada: o lote é lido aqui mesmo
+                logger.warning("Pool de processos indisponível; lendo lote de %d arquivo(s) sequencialmente", len(lote))
+                analisado = _analisar_lote(lote)
+            resultados, segundos, cpu = analisado
+            if desempenho is not None:
+                desempenho.acumular('analise_xml', segundos, cpu, itens=len(lote))
+            for (_, nome_arquivo), (registros, erro) in zip(lote, resultados):
+                yield nome_arquivo, registros, erro
+
+
+def _encadear(inicio, restante):
+    # Entrega os itens já lidos liberando a lista conforme avança
+    inicio.reverse()
+    while inicio:
+        yield inicio.pop()
+    yield from restante
+
+
+def analisar_arquivos(arquivos_para_processar, workers=None, desempenho=None):
+    """
+    Gera (nome_arquivo, registros, erro) para cada tupla (conteudo_xml, nome_arquivo),
+    na mesma ordem da entrada. Com mais de um worker e pelo menos LIMIAR_PARALELO
+    arquivos, a leitura é distribuída em lotes para um pool de processos.
+    desempenho (desempenho.Desempenho), se informado, recebe na etapa
+    'analise_xml' o tempo gasto em cada arquivo, também nos outros processos.
+    """
+    workers = workers or config.WORKERS
+    arquivos = iter(arquivos_para_processar)
+    if workers <= 1:
+        yield from _analisar_sequencial(arquivos, desempenho)
+        return
+    inicio = list(islice(arquivos, LIMIAR_PARALELO))
+    if len(inicio) < LIMIAR_PARALELO:
+        yield from _analisar_sequencial(inicio, desempenho)
+        return
+    yield from _analisar_paralelo(_encadear(inicio, arquivos), workers, desempenho)
+
+
+def _analisar_com_cache(arquivos_para_processar, cache, workers, desempenho=None):
+    # Arquivos já vistos saem do cache; só os demais seguem para analisar_arquivos.
+    # A fila "ordem" guarda a sequência original para intercalar os dois fluxos.
+    ordem = deque()
+
+    def nao_encontrados():
+        for xml_content, nome_arquivo in arquivos_para_processar:
+            sha256 = hash_conteudo(xml_content)
+            registros = cache.buscar(sha256)
+            ordem.append((nome_arquivo, registros, sha256))
+            if registros is None:
+                yield xml_content, nome_arquivo
+
+    for nome_arquivo, registros, erro in analisar_arquivos(nao_encontrados(), workers, desempenho):
+        while True:
+            nome_ordem, registros_cache, sha256 = ordem.popleft()
+            if registros_cache is None:
+                break
+            yield nome_ordem, registros_cache, None
+        if registros:
+            cache.guardar(sha256, registros)
+        yield nome_arquivo, registros, erro
+    while ordem:
+        nome_ordem, registros_cache, _ = ordem.popleft()
+        yield nome_ordem, registros_cache, None
+
+
+def processar_xmls(arquivos_para_processar, progresso=None, total=None, workers=None, cache=None, desempenho=None):
+    """
+    Processa tuplas (conteudo_xml, nome_arquivo) de qualquer iterável, um
+    arquivo por vez: o conteúdo bruto é descartado logo após a leitura, então
+    geradores como entrada.iterar_arquivos mantêm a memória estável.
+    progresso, se informado, é chamado com (processados, total) após cada arquivo.
+    workers define o número de processos de leitura (padrão: config.WORKERS).
+    cache, se informado (cache.CacheRegistros), evita reler XML já processados.
+    desempenho, se informado (desempenho.Desempenho), recebe o tempo de
+    análise dos XML (etapa 'analise_xml').
+    """
+    resultado = ResultadoProcessamento()
+    if total is None and hasattr(arquivos_para_processar, '__len__'):
+        total = len(arquivos_para_processar)
+    if cache is not None:
+        analisados = _analisar_com_cache(arquivos_para_processar, cache, workers, desempenho)
+    else:
+        analisados = analisar_arquivos(arquivos_para_processar, workers, desempenho)
+    for i, (nome_arquivo, registros, erro) in enumerate(analisados):
+        if registros:
+            if isinstance(registros, list):
+                resultado.registros.estender(registros)
+                resultado.total_itens_processados += len(registros)
+            else:
+                resultado.registros.acrescentar(registros)
+                resultado.total_itens_processados += 1
+        else:
+            if erro:
+                resultado.erros.append(erro)
+            resultado.arquivos_nao_processados.append(nome_arquivo)
+            resultado.indices_nao_processados.append(i)
+        if progresso:
+            progresso(i + 1, total)
+    if cache is not None:
+        cache.gravar()
+    return resultado
+
+
+def ordem_por_chave(df):
+    """
+    Posições das linhas de df ordenadas pela chave da nota. A chave é
+    comparada como três inteiros nativos (chaves_para_ordenacao), sem
+    converter cada uma em um inteiro do Python.
+    Linhas sem chave de acesso válida (inutilizações, por exemplo) vêm
+    primeiro, ordenadas pelo Número NFCe (o inicial da faixa); as que também
+    não têm número ficam no fim desse grupo. Empates mantêm a ordem original.
+    """
+    validas, trechos = chaves_para_ordenacao(df['Chave da Nota'])
+    numeros = np.full(len(df), np.iinfo(np.int64).max, dtype=np.int64)
+    sem_chave = ~validas
+    if sem_chave.any():
+        numeros_sem_chave = numeros_inteiros(df['Número NFCe'][sem_chave])
+        numeros[sem_chave] = numeros_sem_chave.fillna(np.iinfo(np.int64).max).to_numpy(dtype=np.int64)
+    # np.lexsort é estável e usa a última chave como principal
+    return np.lexsort((numeros, *reversed(trechos), validas))
+
+
+def montar_dataframe(registros, desempenho=None):
+    """
+    Cria o DataFrame das NFCe ordenado pela chave da nota (ver ordem_por_chave),
+    com as datas convertidas para o fuso de São Paulo (datas.converter_datas).
+    registros é um ColunasRegistros ou uma lista de dicionários.
+    desempenho, se informado, mede as etapas 'conversao_datas' e 'ordenacao'.
+    """
+    if isinstance(registros, ColunasRegistros):
+        df = registros.para_dataframe()
+    else:
+        df = pd.DataFrame(registros)
+    if 'Situação' in df.columns:
+        df['Situação'] = como_categoria(df['Situação'])
+    if 'Data Emissão' in df.columns:
+        with etapa(desempenho, 'conversao_datas', len(df)):
+            df['Data Emissão'] = converter_datas(df['Data Emissão'])
+    if df.empty:
+        return df
+    with etapa(desempenho, 'ordenacao', len(df)):
+        return df.iloc[ordem_por_chave(df)]
+
+
+def calcular_totais(df):
+    """Cria o DataFrame com os totais exibidos na tela e no PDF detalhado"""
+    return pd.DataFrame({
+        'Métrica': [
+            'Total de NFCe',
+            'Valor Total das Notas',
+            'Média por NFCe'
+        ],
+        'Valor': [
+            len(df),
+            f"R$ {df['Valor Total'].sum():,.2f}",
+            f"R$ {df['Valor Total'].mean():,.2f}"
+        ]
+    })
+
+
+# Relatórios disponíveis: tipo -> (prefixo do nome do arquivo, extensão, MIME)
+RELATORIOS = {
+    'excel': ('relatorio', 'xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'pdf': ('relatorio', 'pdf', 'application/pdf'),
+    'resumo': ('relatorio_resumido', 'pdf', 'application/pdf'),
+    'numeros_pulados': ('relatorio_numeros_pulados', 'pdf', 'application/pdf'),
+}
+
+
+def tipos_relatorio(numeros_pulados):
+    """Relatórios que se aplicam ao processamento (o de numerações só se houver saltos)"""
+    tipos = ['excel', 'pdf', 'resumo']
+    if numeros_pulados:
+        tipos.append('numeros_pulados')
+    return tipos
+
+
+def nome_relatorio(tipo, carimbo=None):
+    prefixo, extensao, _ = RELATORIOS[tipo]
+    carimbo = carimbo or datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f'{prefixo}_{carimbo}.{extensao}'
+
+
+def gerar_relatorio(tipo, df, totais, numeros_pulados, destino):
+    """Gera um relatório em destino (caminho ou objeto de arquivo, como io.BytesIO)"""
+    if tipo not in RELATORIOS:
+        raise ValueError(f"Tipo de relatório desconhecido: {tipo}")
+    if tipo == 'excel':
+        gerar_excel(df, destino)
+        return
+    # Padronizar e remover colunas indesejadas
+    if 'CPF/CNPJ Destinatario' in df.columns:
+        df = df.drop(columns=['CPF/CNPJ Destinatario'])
+    if tipo == 'pdf':
+        generate_pdf(df, totais, destino)
+    elif tipo == 'resumo':
+        generate_pdf_resumido(df, destino)
+    else:
+        generate_pdf_numeros_pulados(numeros_pulados, destino)
+
+
+def gerar_relatorio_bytes(tipo, df, totais, numeros_pulados):
+    """Gera um relatório inteiramente em memória e retorna seu conteúdo"""
+    buffer = io.BytesIO()
+    gerar_relatorio(tipo, df, totais, numeros_pulados, buffer)
+    return buffer.getvalue()
+
+
+def gerar_relatorios(df, totais, numeros_pulados, pasta='reports', desempenho=None):
+    """
+    Grava os relatórios na pasta informada (cada um medido como a etapa
+    'relatorio_<tipo>' de desempenho, se informado).
+    Retorna um dicionário com os caminhos gerados ('excel', 'pdf', 'resumo' e,
+    se houver numerações puladas, 'numeros_pulados').
+    """
+    # Criar diretório para relatórios se não existir
+    os.makedirs(pasta, exist_ok=True)
+    carimbo = datetime.now().strftime("%Y%m%d_%H%M%S")
+    caminhos = {}
+    for tipo in tipos_relatorio(numeros_pulados):
+        caminho = os.path.join(pasta, nome_relatorio(tipo, carimbo))
+        # Nunca sobrescreve um relatório gerado no mesmo segundo por outra execução
+        base, extensao = os.path.splitext(caminho)
+        sequencia = 1
+        while True:
+            try:
+                arquivo = open(caminho, 'xb')
+                break
+            except FileExistsError:
+                sequencia += 1
+                caminho = f'{base}_{sequencia}{extensao}'
+        with arquivo, etapa(desempenho, f'relatorio_{tipo}', len(df)):
+            gerar_relatorio(tipo, df, totais, numeros_pulados, arquivo)
+        caminhos[tipo] = caminho
+    return caminhos
+
+
+def atualizar_livro(arquivos_para_processar, livro, progresso=None, total=None, workers=None, cache=None,
+                    desempenho=None):
+    """
+    Lê só os arquivos que o livro (livro.LivroNotas) ainda não viu, pelo
+    SHA-256 do conteúdo, e grava as notas deles no livro (uma linha por
+    chave). Só os arquivos lidos com sucesso são marcados como vistos: um
+    arquivo inválido enviado de novo é relido e tem o erro informado outra vez.
+    Retorna (resultado, df, ignorados): o resultado dos arquivos lidos, o
+    DataFrame (montar_dataframe) das notas deles, ou None se não há notas, e
+    quantos arquivos já estavam no livro.
+    """
+    hashes = []
+    ignorados = [0]
+
+    def novos():
+        for xml_content, nome_arquivo in arquivos_para_processar:
+            sha256 = hash_conteudo(xml_content)
+            if livro.arquivo_lido(sha256):
+                ignorados[0] += 1
+                continue
+            hashes.append(sha256)
+            yield xml_content, nome_arquivo
+
+    def progresso_total(processados, total):
+        progresso(processados + ignorados[0], total)
+
+    with etapa(desempenho, 'leitura') as medida:
+        resultado = processar_xmls(novos(), progresso_total if progresso else None, total, workers, cache, desempenho)
+        medida['itens'] += resultado.total_itens_processados
+    with etapa(desempenho, 'dataframe', len(resultado.registros)):
+        df = montar_dataframe(resultado.registros, desempenho) if resultado.registros else None
+    falhas = set(resultado.indices_nao_processados)
+    lidos = [sha256 for i, sha256 in enumerate(hashes) if i not in falhas]
+    with etapa(desempenho, 'livro_gravacao', len(resultado.registros)):
+        livro.registrar(df, lidos)
+    return resultado, df, ignorados[0]
+
+
+def carregar_livro(livro, inicio=None, fim=None, cnpjs=None):
+    """DataFrame conciliado das notas do livro no período (ver LivroNotas.ler), na forma de montar_dataframe"""
+    return conciliar(montar_dataframe(livro.ler(inicio, fim, cnpjs))).df
+
+
+def carregar_acervo(pasta_acervo, inicio=None, fim=None, cnpjs=None):
+    """
+    DataFrame das notas guardadas no acervo Parquet (ver acervo.ler_acervo),
+    na mesma forma de montar_dataframe e conciliado (um cancelamento gravado
+    depois da nota é juntado a ela), pronto para os relatórios.
+    """
+    return conciliar(montar_dataframe(ler_acervo(pasta_acervo, inicio, fim, cnpjs))).df
+
+
+def _relatorios_guardados(df, pasta, desempenho):
+    if df.empty:
+        return None, {}, {}
+    with etapa(desempenho, 'numeracao', len(df)):
+        numeros_pulados = detectar_numeracoes_puladas(df)
+    caminhos = gerar_relatorios(df, calcular_totais(df), numeros_pulados, pasta, desempenho)
+    return df, numeros_pulados, caminhos
+
+
+def executar_acervo(pasta_acervo, pasta='reports', inicio=None, fim=None, cnpjs=None, desempenho=None):
+    """
+    Gera os relatórios a partir do acervo, sem reler os XML. Retorna
+    (df, numeros_pulados, caminhos); df é None quando o filtro não encontra notas.
+    """
+    with etapa(desempenho, 'acervo_leitura') as medida:
+        df = carregar_acervo(pasta_acervo, inicio, fim, cnpjs)
+        medida['itens'] += len(df)
+    return _relatorios_guardados(df, pasta, desempenho)
+
+
+def executar_livro(livro, pasta='reports', inicio=None, fim=None, cnpjs=None, desempenho=None):
+    """Como executar_acervo, lendo as notas do livro (livro.LivroNotas)"""
+    with etapa(desempenho, 'livro_leitura') as medida:
+        df = carregar_livro(livro, inicio, fim, cnpjs)
+        medida['itens'] += len(df)
+    return _relatorios_guardados(df, pasta, desempenho)
+
+
+def executar(arquivos_para_processar, pasta='reports', progresso=None, total=None, workers=None, cache=None,
+             acervo=None, livro=None, inicio=None, fim=None, desempenho=None):
+    """
+    Executa o fluxo completo sem interface: leitura, DataFrame, conciliação dos
+    cancelamentos (resultado.conciliacao), verificação de numeração e
+    relatórios. Com livro (livro.LivroNotas), só os arquivos novos
+    são lidos e os relatórios saem do livro, nos meses de inicio a fim. Com
+    acervo, as notas também são gravadas no acervo Parquet dessa pasta.
+    desempenho (desempenho.Desempenho), se informado, recebe o tempo, a CPU,
+    os itens e a memória de cada etapa.
+    Retorna (resultado, df, numeros_pulados, caminhos); df é None quando não
+    há notas para os relatórios.
+    """
+    if livro is not None:
+        resultado, _, _ = atualizar_livro(arquivos_para_processar, livro, progresso, total, workers, cache, desempenho)
+        with etapa(desempenho, 'livro_leitura') as medida:
+            df = montar_dataframe(livro.ler(inicio, fim))
+            medida['itens'] += len(df)
+        if df.empty:
+            return resultado, None, [], {}
+    else:
+        with etapa(desempenho, 'leitura') as medida:
+            resultado = processar_xmls(arquivos_para_processar, progresso, total, workers, cache, desempenho)
+            medida['itens'] += resultado.total_itens_processados
+        if not resultado.registros:
+            return resultado, None, [], {}
+        with etapa(desempenho, 'dataframe', len(resultado.registros)):
+            df = montar_dataframe(resultado.registros, desempenho)
+    with etapa(desempenho, 'conciliacao', len(df)):
+        resultado.conciliacao = conciliar(df)
+    df = resultado.conciliacao.df
+    if acervo:
+        with etapa(desempenho, 'acervo_gravacao', len(df)):
+            gravar_acervo(df, acervo)
+    with etapa(desempenho, 'numeracao', len(df)):
+        numeros_pulados = detectar_numeracoes_puladas(df)
+    caminhos = gerar_relatorios(df, calcular_totais(df), numeros_pulados, pasta, desempenho)
+    return resultado, df, numeros_pulados, caminhos
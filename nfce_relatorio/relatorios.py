@@ -0,0 +1,433 @@
+import unicodedata
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.lib.enums import TA_CENTER
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from .datas import sem_fuso
+from .numeracao import descrever_grupo, formatar_intervalos, total_pulados
+from .resumo import calcular_resumo, totais_resumo
+from .config import LOGO_PATH
+from .situacao import mascaras
+
+# A partir deste número de notas o PDF detalhado usa o modo rápido
+LIMIAR_PDF_RAPIDO = 1000
+
+# Linhas de cada tabela no modo rápido (cerca de uma página)
+LINHAS_POR_BLOCO = 40
+
+# Espaçamento horizontal das células no modo rápido (o padrão do ReportLab é 6),
+# para que a chave de acesso caiba na coluna sem quebra de linha
+PADDING_RAPIDO = 3
+
+
+def _linhas_rapidas(df_pdf, col_widths, cell_style):
+    """
+    Linhas da tabela detalhada para o modo rápido: textos que cabem na coluna
+    ficam como texto simples e só os demais viram Paragraph, todos com o
+    mesmo estilo.
+    """
+    colunas = []
+    for col, largura in zip(df_pdf.columns, col_widths):
+        disponivel = largura - 2 * PADDING_RAPIDO
+        # Nenhum caractere da Helvetica passa de 1,015 em de largura
+        limite_caracteres = int(disponivel / (cell_style.fontSize * 1.015))
+        colunas.append([
+            texto if len(texto) <= limite_caracteres
+            or stringWidth(texto, 'Helvetica', cell_style.fontSize) <= disponivel
+            else Paragraph(texto, cell_style)
+            for texto in map(str, df_pdf[col].to_numpy(dtype=object))
+        ])
+    return [list(linha) for linha in zip(*colunas)]
+
+
+# Função para gerar PDF
+def generate_pdf(df, totais, output_path, rapido=None):
+    """
+    Gera o relatório PDF detalhado. No modo rápido (automático a partir de
+    LIMIAR_PDF_RAPIDO notas) as células reaproveitam um único estilo, textos
+    curtos não viram Paragraph e cada tabela tem cerca de uma página, para que
+    tempo e memória cresçam linearmente com o número de notas. O conteúdo das
+    páginas é sempre comprimido.
+    """
+    # Datas exibidas no horário de São Paulo, sem o offset
+    df = sem_fuso(df)
+    doc = SimpleDocTemplate(
+        output_path,
+        pagesize=landscape(A4),
+        leftMargin=20,
+        rightMargin=20,
+        topMargin=20,
+        bottomMargin=20,
+        pageCompression=1
+    )
+    styles = getSampleStyleSheet()
+    elements = []
+
+    # Estilo personalizado para títulos centralizados
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        spaceAfter=30,
+        alignment=TA_CENTER
+    )
+    subtitle_style = ParagraphStyle(
+        'CustomSubtitle',
+        parent=styles['Heading2'],
+        fontSize=13,
+        spaceAfter=10,
+        alignment=TA_CENTER
+    )
+
+    # Adicionar logo e título na mesma linha usando uma tabela
+    try:
+        logo_path = LOGO_PATH
+        logo = Image(logo_path, width=60, height=60, hAlign='RIGHT')
+        logo_col_width = 70 # Largura da coluna da logo, com um pequeno padding
+
+        # Ajuste para centralizar o título visualmente, empurrando-o um pouco mais para a direita.
+        # Este valor pode ser ajustado conforme a necessidade visual.
+        offset_to_right = 0 # Valor em pontos para deslocar o título para a direita
+        left_spacer_width = logo_col_width + offset_to_right
+        title_col_width = doc.width - left_spacer_width - logo_col_width
+
+        header_table = Table(
+            [[Spacer(left_spacer_width, 1), Paragraph("Relatório de NFCe", title_style), logo]],
+            colWidths=[left_spacer_width, title_col_width, logo_col_width]
+        )
+
+    except Exception:
+        # Caso a logo não carregue, apenas o título centralizado
+        header_table = Table(
+            [[Paragraph("Relatório de NFCe", title_style)]],
+            colWidths=[doc.width]
+        )
+
+    header_table.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        # Remover alinhamento específico para a coluna da logo, pois já está no Image e no colWidths
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+        ('TOPPADDING', (0, 0), (-1, -1), 0),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+    ]))
+    elements.append(header_table)
+    elements.append(Spacer(1, 20))
+
+    # Resumo centralizado
+    elements.append(Paragraph("Resumo", subtitle_style))
+    elements.append(Spacer(1, 10))
+
+    # Criar tabela de resumo
+    resumo_data = [['Métrica', 'Valor']]
+    for _, row in totais.iterrows():
+        resumo_data.append([row['Métrica'], row['Valor']])
+
+    resumo_table = Table(resumo_data, colWidths=[3*inch, 2*inch])
+    resumo_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ]))
+
+    elements.append(resumo_table)
+    elements.append(Spacer(1, 30))
+
+    # Separar dados em normais, inutilizados e cancelados
+    normais, inutilizadas, canceladas = mascaras(df)
+    df_canceladas = df[canceladas]
+    df_inutilizados = df[inutilizadas]
+    df_normais = df[normais]
+
+    # Remover colunas indesejadas para o PDF
+    # Agora incluindo a coluna 'Justificativa' para exibição
+    colunas_pdf = [
+        c for c in df.columns
+        if c not in [
+            'Emitente', 'CNPJ Emitente', 'Base ICMS', 'ICMS', 'PIS', 'COFINS', 'Total de Produtos', 'Situação'
+        ]
+    ]
+
+    # Ajustar larguras das colunas
+    # Adapte as larguras conforme as novas colunas e a necessidade de espaço
+    col_widths = [1*inch, 2.5*inch, 0.6*inch, 1.1*inch, 0.8*inch, 0.8*inch, 1.2*inch, 1.2*inch, 1.5*inch] # Adicionado espaço para Justificativa
+    if len(colunas_pdf) != len(col_widths):
+        col_widths = [1.1*inch] * len(colunas_pdf) # Fallback se as larguras não baterem
+
+    estilo_tabela = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
+        ('TOPPADDING', (0, 0), (-1, 0), 6),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 7),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 2),
+        ('TOPPADDING', (0, 1), (-1, 1), 2),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ])
+    estilo_rapido = TableStyle([
+        ('LEFTPADDING', (0, 1), (-1, -1), PADDING_RAPIDO),
+        ('RIGHTPADDING', (0, 1), (-1, -1), PADDING_RAPIDO),
+    ])
+    if rapido is None:
+        rapido = len(df) >= LIMIAR_PDF_RAPIDO
+    header_style = ParagraphStyle(name='HeaderCell', fontSize=9, alignment=TA_CENTER, leading=10, wordWrap='CJK')
+    cell_style = ParagraphStyle(name='TableCell', fontSize=7, alignment=TA_CENTER, leading=8, wordWrap='CJK')
+
+    # Função auxiliar para criar tabela
+    def create_table(df_subset, title):
+        if len(df_subset) == 0:
+            return None
+        elements.append(Paragraph(title, subtitle_style))
+        elements.append(Spacer(1, 10))
+        df_pdf = df_subset[colunas_pdf]
+        cabecalho = [Paragraph(str(col), header_style) for col in df_pdf.columns]
+        if rapido:
+            # Tabelas de cerca de uma página: o ReportLab não precisa dividir uma tabela enorme
+            linhas = _linhas_rapidas(df_pdf, col_widths, cell_style)
+            for inicio in range(0, len(linhas), LINHAS_POR_BLOCO):
+                table = Table([cabecalho] + linhas[inicio:inicio + LINHAS_POR_BLOCO], colWidths=col_widths, repeatRows=1)
+                table.setStyle(estilo_tabela)
+                table.setStyle(estilo_rapido)
+                elements.append(table)
+            elements.append(Spacer(1, 20))
+            return
+        table_data = [cabecalho]
+        for _, row in df_pdf.iterrows():
+            table_data.append([Paragraph(str(cell), cell_style) for cell in row.tolist()])
+        table = Table(table_data, colWidths=col_widths, repeatRows=1)
+        table.setStyle(estilo_tabela)
+        elements.append(table)
+        elements.append(Spacer(1, 20))
+
+    # Criar tabelas separadas
+    create_table(df_normais, "NFCe Emitidas")
+    create_table(df_inutilizados, "NFCe Inutilizadas")
+    create_table(df_canceladas, "NFCe Canceladas")
+
+    # Gerar PDF
+    doc.build(elements)
+
+
+def normalize_str(s):
+    if not isinstance(s, str):
+        return ''
+    return unicodedata.normalize('NFKD', s).encode('ASCII', 'ignore').decode('ASCII').upper()
+
+
+def generate_pdf_resumido(df, output_path, resumo=None):
+    """resumo é o calcular_resumo(df) mensal, se já tiver sido calculado"""
+    # Lista de meses em português
+    meses_pt = [
+        '', 'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+        'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro'
+    ]
+
+    doc = SimpleDocTemplate(
+        output_path,
+        pagesize=landscape(A4),
+        leftMargin=20,
+        rightMargin=20,
+        topMargin=20,
+        bottomMargin=20
+    )
+    styles = getSampleStyleSheet()
+    elements = []
+
+    # Título centralizado e logo
+    try:
+        logo_path = LOGO_PATH
+        logo = Image(logo_path, width=60, height=60, hAlign='RIGHT')
+        logo_col_width = 70
+        left_spacer_width = logo_col_width
+        title_col_width = doc.width - left_spacer_width - logo_col_width
+        header_table = Table(
+            [[Spacer(left_spacer_width, 1), Paragraph("Relatório Resumido de NFCe por Mês", ParagraphStyle('ResumoTitle', parent=styles['Heading1'], fontSize=16, spaceAfter=30, alignment=TA_CENTER)), logo]],
+            colWidths=[left_spacer_width, title_col_width, logo_col_width]
+        )
+    except Exception:
+        header_table = Table(
+            [[Paragraph("Relatório Resumido de NFCe por Mês", ParagraphStyle('ResumoTitle', parent=styles['Heading1'], fontSize=16, spaceAfter=30, alignment=TA_CENTER))]],
+            colWidths=[doc.width]
+        )
+    header_table.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+        ('TOPPADDING', (0, 0), (-1, -1), 0),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+    ]))
+    elements.append(header_table)
+    elements.append(Spacer(1, 20))
+
+    # Agregados por mês em uma única passagem; os meses listados são os que
+    # têm notas autorizadas ou canceladas com data (inutilizadas só no total)
+    if resumo is None:
+        resumo = calcular_resumo(df)
+    meses = resumo[resumo.index.notna() & (resumo['Notas Autorizadas'] + resumo['Notas Canceladas'] > 0)]
+    for mes, linha in meses.iterrows():
+        mes_nome = f"{meses_pt[mes.month]}/{mes.year}"
+        # Tabela resumo do mês
+        resumo_data = [
+            ["Mês/Ano", mes_nome],
+            ["Notas Autorizadas", int(linha['Notas Autorizadas'])],
+            ["Valor Total Autorizadas", f"R$ {linha['Valor Autorizadas']:,.2f}"],
+            ["Notas Canceladas", int(linha['Notas Canceladas'])],
+        ]
+        table = Table(resumo_data, colWidths=[2.5*inch, 3*inch])
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 10),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ]))
+        elements.append(table)
+        elements.append(Spacer(1, 20))
+    # Totalizador final (inutilizadas só no total geral)
+    totais = totais_resumo(resumo)
+    totalizador_data = [
+        ["TOTAL DE NOTAS AUTORIZADAS", totais['Notas Autorizadas']],
+        ["VALOR TOTAL AUTORIZADAS", f"R$ {totais['Valor Autorizadas']:,.2f}"],
+        ["TOTAL DE NOTAS INUTILIZADAS", totais['Notas Inutilizadas']],
+        ["TOTAL DE NOTAS CANCELADAS", totais['Notas Canceladas']],
+    ]
+    totalizador_table = Table(totalizador_data, colWidths=[3*inch, 2.5*inch])
+    totalizador_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#333333')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 11),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ]))
+    elements.append(Spacer(1, 30))
+    elements.append(Paragraph("Totalizador Geral", ParagraphStyle('TotalTitle', parent=styles['Heading2'], alignment=TA_CENTER, fontSize=14, spaceAfter=10)))
+    elements.append(totalizador_table)
+    doc.build(elements)
+
+
+# Função para gerar relatório de números pulados
+def generate_pdf_numeros_pulados(numeros_pulados, output_path):
+    """
+    Gera um relatório PDF específico para números pulados, recebidos como em
+    detectar_numeracoes_puladas: {grupo: [(inicio, fim), ...]}
+    """
+    doc = SimpleDocTemplate(
+        output_path,
+        pagesize=A4,
+        leftMargin=20,
+        rightMargin=20,
+        topMargin=20,
+        bottomMargin=20
+    )
+    styles = getSampleStyleSheet()
+    elements = []
+
+    # Estilo personalizado para títulos
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        spaceAfter=30,
+        alignment=TA_CENTER
+    )
+
+    # Adicionar logo e título
+    try:
+        logo_path = LOGO_PATH
+        logo = Image(logo_path, width=60, height=60, hAlign='RIGHT')
+        logo_col_width = 70
+        left_spacer_width = logo_col_width
+        title_col_width = doc.width - left_spacer_width - logo_col_width
+        header_table = Table(
+            [[Spacer(left_spacer_width, 1), Paragraph("Relatório de Numerações Puladas", title_style), logo]],
+            colWidths=[left_spacer_width, title_col_width, logo_col_width]
+        )
+    except Exception:
+        header_table = Table(
+            [[Paragraph("Relatório de Numerações Puladas", title_style)]],
+            colWidths=[doc.width]
+        )
+
+    header_table.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+        ('TOPPADDING', (0, 0), (-1, -1), 0),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+    ]))
+    elements.append(header_table)
+    elements.append(Spacer(1, 20))
+
+    if numeros_pulados:
+        # Uma tabela por CNPJ, modelo e série
+        for grupo, intervalos in numeros_pulados.items():
+            elements.append(Paragraph(descrever_grupo(grupo), styles['Heading3']))
+            data = [['Intervalos de Numeração Pulada']]
+            for intervalo in formatar_intervalos(intervalos):
+                data.append([intervalo])
+            table = Table(data, colWidths=[3*inch], repeatRows=1)
+            table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.red),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 12),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+                ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+                ('FONTSIZE', (0, 1), (-1, -1), 10),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ]))
+            elements.append(table)
+            elements.append(Spacer(1, 6))
+            elements.append(Paragraph(f"Numerações puladas neste grupo: {total_pulados(intervalos)}", styles['Normal']))
+            elements.append(Spacer(1, 14))
+        resumo_text = f"Total de numerações puladas encontradas: {total_pulados(numeros_pulados)}"
+        elements.append(Paragraph(resumo_text, styles['Normal']))
+    else:
+        elements.append(Paragraph("Nenhuma numeração pulada foi encontrada.", styles['Normal']))
+
+    # Gerar PDF
+    doc.build(elements)
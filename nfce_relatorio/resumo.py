@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+from .chave import decodificar_chaves, formatar_cnpj
+from .datas import horario_local
+from .situacao import mascaras
+
+# Granularidades do resumo: nome -> frequência do Period do pandas
+PERIODOS = {'mes': 'M', 'dia': 'D'}
+
+# Classe de cada nota no resumo, na mesma partição dos relatórios (código -> nome)
+_CLASSES = ['Autorizadas', 'Canceladas', 'Inutilizadas']
+
+COLUNAS_RESUMO = [
+    'Notas Autorizadas',
+    'Valor Autorizadas',
+    'Notas Canceladas',
+    'Valor Canceladas',
+    'Notas Inutilizadas',
+]
+
+
+def _datas_locais(datas):
+    # Períodos pelo horário de São Paulo (datas com fuso) ou como vieram (sem fuso)
+    if isinstance(datas.dtype, pd.DatetimeTZDtype):
+        return horario_local(datas)
+    return pd.Series(pd.to_datetime(datas, errors='coerce'), index=datas.index)
+
+
+def calcular_resumo(df, periodo='mes', por_loja=False):
+    """
+    Agrega as notas por período ('mes' ou 'dia') e, se por_loja, pelo CNPJ do
+    emitente (tirado da chave), em um único groupby sobre códigos: quantidade
+    e valor das autorizadas e das canceladas e quantidade de inutilizadas.
+    Autorizadas são as demais notas, como em situacao.mascaras.
+    Os períodos seguem o horário de São Paulo. Notas sem data ficam no período
+    NaT e notas sem chave (inutilizações) com CNPJ nulo.
+    """
+    _, inutilizadas, canceladas = mascaras(df)
+    codigos = np.select([canceladas, inutilizadas], [1, 2], 0).astype(np.int8)
+    chaves = [
+        _datas_locais(df['Data Emissão']).dt.to_period(PERIODOS[periodo]).rename('Período'),
+    ]
+    if por_loja:
+        chaves.append(decodificar_chaves(df['Chave da Nota'])['CNPJ'].rename('CNPJ Emitente'))
+    chaves.append(pd.Series(pd.Categorical.from_codes(codigos, categories=_CLASSES), index=df.index, name='Classe'))
+
+    valores = pd.to_numeric(df['Valor Total'], errors='coerce')
+    agregado = valores.groupby(chaves, dropna=False, observed=True).agg(['size', 'sum'])
+    tabela = agregado.unstack('Classe', fill_value=0).reindex(
+        columns=pd.MultiIndex.from_product([['size', 'sum'], _CLASSES]), fill_value=0
+    )
+
+    resumo = pd.DataFrame({
+        'Notas Autorizadas': tabela[('size', 'Autorizadas')].astype(np.int64),
+        'Valor Autorizadas': tabela[('sum', 'Autorizadas')].astype(np.float64),
+        'Notas Canceladas': tabela[('size', 'Canceladas')].astype(np.int64),
+        'Valor Canceladas': tabela[('sum', 'Canceladas')].astype(np.float64),
+        'Notas Inutilizadas': tabela[('size', 'Inutilizadas')].astype(np.int64),
+    }, index=tabela.index)
+    return resumo
+
+
+def totais_resumo(resumo):
+    """
+    Totais gerais de um resumo: autorizadas e canceladas só contam as notas
+    com data (as que aparecem nos períodos); inutilizadas contam todas.
+    """
+    com_data = resumo[resumo.index.get_level_values('Período').notna()]
+    totais = {coluna: com_data[coluna].sum() for coluna in COLUNAS_RESUMO}
+    totais['Notas Inutilizadas'] = resumo['Notas Inutilizadas'].sum()
+    return {coluna: int(valor) if coluna.startswith('Notas') else float(valor) for coluna, valor in totais.items()}
+
+
+def tabela_resumo(resumo):
+    """Resumo de calcular_resumo como tabela simples (planilha e tela), com período e CNPJ em texto"""
+    tabela = resumo.reset_index()
+    tabela['Período'] = tabela['Período'].astype(object).where(tabela['Período'].notna(), 'Sem data').astype(str)
+    if 'CNPJ Emitente' in tabela.columns:
+        tabela['CNPJ Emitente'] = [
+            'Sem chave' if pd.isna(cnpj) else formatar_cnpj(cnpj) for cnpj in tabela['CNPJ Emitente']
+        ]
+    return tabela
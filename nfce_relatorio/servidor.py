@@ -0,0 +1,389 @@
+import hmac
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from . import config
+from .cache import abrir_cache
+from .desempenho import Desempenho
+from .entrada import contar_caminhos, iterar_caminhos, ler_antecipado
+from .numeracao import descrever_grupo, total_pulados
+from .pipeline import RELATORIOS, executar
+from .resumo import calcular_resumo, totais_resumo
+from .tarefas import CONCLUIDA, FALHOU, FilaTarefas
+
+logger = logging.getLogger(__name__)
+
+# Trechos copiados por vez entre a conexão e o disco
+TAMANHO_BLOCO = 1024 * 1024
+
+# Nome do arquivo enviado sem ?nome=, pelo Content-Type
+NOMES_POR_TIPO = {
+    'application/zip': 'lote.zip',
+    'application/x-zip-compressed': 'lote.zip',
+    'application/xml': 'lote.xml',
+    'text/xml': 'lote.xml',
+}
+
+_ID_LOTE = re.compile(r'[0-9a-f]{32}')
+
+
+class ErroRequisicao(Exception):
+    """Requisição recusada, com o status HTTP da resposta"""
+
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+
+def _gravar_json(caminho, dados):
+    # Quem consulta o lote nunca lê o resultado pela metade
+    temporario = f'{caminho}.{uuid.uuid4().hex}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(dados, arquivo, ensure_ascii=False)
+    os.replace(temporario, caminho)
+
+
+def resumir_lote(id_lote, resultado, df, numeros_pulados, caminhos):
+    """Resultado de um lote em JSON: totais, conciliação, numerações puladas e endereço de cada relatório"""
+    resposta = {
+        'id': id_lote,
+        'situacao': CONCLUIDA,
+        'itens_processados': resultado.total_itens_processados,
+        'arquivos_nao_processados': resultado.arquivos_nao_processados,
+        'erros': resultado.erros,
+        'totais': None,
+        'conciliacao': None,
+        'numeros_pulados': [],
+        'relatorios': {},
+    }
+    if df is None:
+        return resposta
+    totais = {'Total de NFCe': len(df), 'Valor Total': round(float(df['Valor Total'].sum()), 2)}
+    totais.update(totais_resumo(calcular_resumo(df)))
+    resposta['totais'] = totais
+    conciliacao = resultado.conciliacao
+    resposta['conciliacao'] = {
+        'canceladas': conciliacao.canceladas,
+        'duplicadas': conciliacao.duplicadas,
+        'eventos_orfaos': conciliacao.eventos_orfaos['Chave da Nota'].astype(str).tolist(),
+    }
+    for grupo, intervalos in numeros_pulados.items():
+        cnpj, modelo, serie = grupo if grupo is not None else (None, None, None)
+        resposta['numeros_pulados'].append({
+            'grupo': descrever_grupo(grupo),
+            'cnpj': cnpj,
+            'modelo': modelo,
+            'serie': serie,
+            'intervalos': [[inicio, fim] for inicio, fim in intervalos],
+            'total': total_pulados(intervalos),
+        })
+    for tipo, caminho in caminhos.items():
+        resposta['relatorios'][tipo] = {
+            'url': f'/lotes/{id_lote}/relatorios/{tipo}',
+            'arquivo': os.path.basename(caminho),
+        }
+    return resposta
+
+
+def processar_lote(pasta_lote, nome, progresso=None):
+    """
+    Processa o arquivo enviado a um lote (pasta_lote/entrada/nome) com o mesmo
+    fluxo da linha de comando e grava pasta_lote/resultado.json, com os
+    relatórios em pasta_lote/relatorios. O arquivo enviado é apagado ao final.
+    """
+    id_lote = os.path.basename(pasta_lote)
+    entrada = os.path.join(pasta_lote, 'entrada', nome)
+    caminho_resultado = os.path.join(pasta_lote, 'resultado.json')
+    try:
+        erros = []
+        desempenho = Desempenho(memoria=config.DESEMPENHO_MEMORIA)
+        total = contar_caminhos([entrada])
+        arquivos = ler_antecipado(desempenho.medir_iteravel('descompactacao', iterar_caminhos([entrada], erros)))
+        cache = abrir_cache()
+        try:
+            resultado, df, numeros_pulados, caminhos = executar(
+                arquivos, pasta=os.path.join(pasta_lote, 'relatorios'), progresso=progresso, total=total,
+                cache=cache, desempenho=desempenho
+            )
+        finally:
+            if cache is not None:
+                cache.fechar()
+        resultado.erros[:0] = erros
+        resposta = resumir_lote(id_lote, resultado, df, numeros_pulados, caminhos)
+        resposta['desempenho'] = desempenho.para_dict()
+    except Exception as e:
+        _gravar_json(caminho_resultado, {'id': id_lote, 'situacao': FALHOU, 'erro': str(e) or type(e).__name__})
+        raise
+    finally:
+        shutil.rmtree(os.path.join(pasta_lote, 'entrada'), ignore_errors=True)
+    _gravar_json(caminho_resultado, resposta)
+    return resposta
+
+
+class ServidorNFCe(ThreadingHTTPServer):
+    """
+    Serviço HTTP para sistemas que enviam os XML automaticamente (um ERP, por
+    exemplo), sem passar pelo upload do Streamlit:
+
+    POST /lotes?nome=loja.zip         corpo: o ZIP ou XML (Content-Length ou chunked)
+    GET  /lotes/<id>                  situação, progresso e, ao terminar, o resultado em JSON
+    GET  /lotes/<id>/relatorios/<tipo> relatório (excel, pdf, resumo ou numeros_pulados)
+    GET  /saude                       processamentos na fila
+
+    O corpo é copiado para o disco aos poucos, sem ficar inteiro na memória, e
+    cada lote vai para a fila de processamentos (tarefas.FilaTarefas), com
+    rodízio entre os endereços dos clientes. Cada conexão é atendida por uma
+    thread. Com token, toda requisição precisa de "Authorization: Bearer <token>".
+    """
+
+    daemon_threads = True
+
+    def __init__(self, endereco, pasta=None, workers=None, token=None, limite_bytes=None, validade_dias=None):
+        self.pasta = pasta or config.SERVIDOR_PASTA
+        self.token = token
+        self.limite_bytes = limite_bytes or config.SERVIDOR_LIMITE_MB * 1024 * 1024
+        self.validade_dias = config.SERVIDOR_VALIDADE_DIAS if validade_dias is None else validade_dias
+        self.fila = FilaTarefas(workers or config.TAREFAS_WORKERS, config.TAREFAS_VALIDADE)
+        # Lotes sendo processados nesta execução do servidor: id do lote -> id da tarefa
+        self.lotes = {}
+        self._trava = threading.Lock()
+        os.makedirs(self.pasta, exist_ok=True)
+        super().__init__(endereco, ManipuladorNFCe)
+
+    @property
+    def url(self):
+        host, porta = self.server_address[:2]
+        return f'http://{host}:{porta}'
+
+    def pasta_lote(self, id_lote):
+        return os.path.join(self.pasta, id_lote)
+
+    def novo_lote(self, nome, corpo, dono):
+        """Copia o corpo da requisição para a pasta de um novo lote e o põe na fila; retorna o id do lote"""
+        self.remover_antigos()
+        id_lote = uuid.uuid4().hex
+        pasta_lote = self.pasta_lote(id_lote)
+        os.makedirs(os.path.join(pasta_lote, 'entrada'))
+        try:
+            with open(os.path.join(pasta_lote, 'entrada', nome), 'wb') as arquivo:
+                for bloco in corpo:
+                    arquivo.write(bloco)
+        except BaseException:
+            shutil.rmtree(pasta_lote, ignore_errors=True)
+            raise
+        with self._trava:
+            self.lotes[id_lote] = self.fila.enviar(processar_lote, pasta_lote, nome, dono=dono)
+        return id_lote
+
+    def situacao_lote(self, id_lote):
+        """JSON da situação do lote, ou None se ele não existe"""
+        pasta_lote = self.pasta_lote(id_lote)
+        caminho_resultado = os.path.join(pasta_lote, 'resultado.json')
+        with self._trava:
+            id_tarefa = self.lotes.get(id_lote)
+            if os.path.exists(caminho_resultado):
+                # O resultado está no disco: a tarefa não precisa mais ficar na fila
+                if id_tarefa is not None and self.fila.buscar(id_tarefa) is not None:
+                    del self.lotes[id_lote]
+                with open(caminho_resultado, encoding='utf-8') as arquivo:
+                    return json.load(arquivo)
+        if not os.path.isdir(pasta_lote):
+            return None
+        tarefa = self.fila.tarefa(id_tarefa) if id_tarefa is not None else None
+        if tarefa is None:
+            return {'id': id_lote, 'situacao': FALHOU, 'erro': 'processamento interrompido (servidor reiniciado)'}
+        return {
+            'id': id_lote,
+            'situacao': tarefa.situacao,
+            'posicao_fila': self.fila.posicao(id_tarefa),
+            'processados': tarefa.processados,
+            'total': tarefa.total,
+        }
+
+    def remover_antigos(self):
+        """Apaga os lotes terminados há mais de validade_dias"""
+        if not self.validade_dias:
+            return
+        limite = time.time() - self.validade_dias * 86400
+        for id_lote in os.listdir(self.pasta):
+            caminho_resultado = os.path.join(self.pasta_lote(id_lote), 'resultado.json')
+            try:
+                antigo = os.path.getmtime(caminho_resultado) < limite
+            except OSError:
+                continue
+            if antigo:
+                shutil.rmtree(self.pasta_lote(id_lote), ignore_errors=True)
+
+    def server_close(self):
+        super().server_close()
+        self.fila.fechar(esperar=False)
+
+
+class ManipuladorNFCe(BaseHTTPRequestHandler):
+    """Requisições do ServidorNFCe"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'nfce-relatorio'
+
+    def do_GET(self):
+        self._atender(self._get)
+
+    def do_POST(self):
+        self._atender(self._post)
+
+    def _atender(self, metodo):
+        self._cabecalhos_enviados = False
+        try:
+            self._autorizar()
+            metodo(urlsplit(self.path))
+        except ErroRequisicao as erro:
+            # O corpo não lido da requisição impede reaproveitar a conexão
+            self.close_connection = True
+            self._responder_json(erro.status, {'erro': str(erro)})
+        except Exception:
+            logger.exception("Erro ao atender %s %s", self.command, self.path)
+            self.close_connection = True
+            # Com a resposta já começada, só resta encerrar a conexão
+            if not self._cabecalhos_enviados:
+                self._responder_json(HTTPStatus.INTERNAL_SERVER_ERROR, {'erro': 'erro interno do servidor'})
+
+    def end_headers(self):
+        self._cabecalhos_enviados = True
+        super().end_headers()
+
+    def _autorizar(self):
+        token = self.server.token
+        if not token:
+            return
+        # O http.server decodifica os cabeçalhos como latin-1; a comparação é feita em bytes,
+        # que aceitam qualquer caractere enviado pelo cliente
+        recebido = self.headers.get('Authorization', '').encode('latin-1', errors='replace')
+        if not hmac.compare_digest(recebido, f'Bearer {token}'.encode('utf-8')):
+            raise ErroRequisicao(HTTPStatus.UNAUTHORIZED, 'token inválido ou ausente')
+
+    def _get(self, url):
+        partes = url.path.strip('/').split('/')
+        if partes == ['saude']:
+            self._responder_json(HTTPStatus.OK, {'situacao': 'ok', 'fila': len(self.server.fila)})
+            return
+        if partes[0] != 'lotes' or len(partes) not in (2, 4) or not _ID_LOTE.fullmatch(partes[1]):
+            raise ErroRequisicao(HTTPStatus.NOT_FOUND, 'endereço inexistente')
+        situacao = self.server.situacao_lote(partes[1])
+        if situacao is None:
+            raise ErroRequisicao(HTTPStatus.NOT_FOUND, 'lote inexistente')
+        if len(partes) == 2:
+            self._responder_json(HTTPStatus.OK, situacao)
+            return
+        if partes[2] != 'relatorios' or partes[3] not in RELATORIOS:
+            raise ErroRequisicao(HTTPStatus.NOT_FOUND, 'endereço inexistente')
+        if situacao['situacao'] != CONCLUIDA:
+            raise ErroRequisicao(HTTPStatus.CONFLICT, f"lote {situacao['situacao']}")
+        relatorio = situacao['relatorios'].get(partes[3])
+        if relatorio is None:
+            raise ErroRequisicao(HTTPStatus.NOT_FOUND, 'relatório não gerado para este lote')
+        caminho = os.path.join(self.server.pasta_lote(partes[1]), 'relatorios', relatorio['arquivo'])
+        self._responder_arquivo(caminho, RELATORIOS[partes[3]][2])
+
+    def _post(self, url):
+        if url.path.rstrip('/') != '/lotes':
+            raise ErroRequisicao(HTTPStatus.NOT_FOUND, 'endereço inexistente')
+        nome = self._nome_arquivo(parse_qs(url.query).get('nome', [None])[0])
+        id_lote = self.server.novo_lote(nome, self._corpo(), dono=self.client_address[0])
+        situacao = self.server.situacao_lote(id_lote)
+        situacao['url'] = f'/lotes/{id_lote}'
+        self._responder_json(HTTPStatus.ACCEPTED, situacao, {'Location': situacao['url']})
+
+    def _nome_arquivo(self, nome):
+        if not nome:
+            tipo = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            nome = NOMES_POR_TIPO.get(tipo)
+        nome = os.path.basename(nome or '')
+        if not nome.lower().endswith(('.zip', '.xml')):
+            raise ErroRequisicao(HTTPStatus.UNSUPPORTED_MEDIA_TYPE,
+                                 'envie um arquivo .zip ou .xml (informe ?nome= ou o Content-Type)')
+        return nome
+
+    def _corpo(self):
+        """Blocos do corpo da requisição, com Content-Length ou Transfer-Encoding: chunked"""
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            blocos = self._corpo_chunked()
+        else:
+            try:
+                tamanho = int(self.headers['Content-Length'])
+            except (TypeError, ValueError):
+                raise ErroRequisicao(HTTPStatus.LENGTH_REQUIRED, 'informe Content-Length ou use chunked') from None
+            if tamanho > self.server.limite_bytes:
+                raise ErroRequisicao(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'arquivo maior que o limite do servidor')
+            blocos = self._corpo_tamanho(tamanho)
+        return self._limitar(blocos)
+
+    def _corpo_tamanho(self, tamanho):
+        while tamanho > 0:
+            bloco = self.rfile.read(min(tamanho, TAMANHO_BLOCO))
+            if not bloco:
+                raise ErroRequisicao(HTTPStatus.BAD_REQUEST, 'conexão encerrada antes do fim do corpo')
+            tamanho -= len(bloco)
+            yield bloco
+
+    def _corpo_chunked(self):
+        while True:
+            linha = self.rfile.readline(1024)
+            try:
+                tamanho = int(linha.split(b';')[0].strip(), 16)
+            except ValueError:
+                raise ErroRequisicao(HTTPStatus.BAD_REQUEST, 'trecho chunked inválido') from None
+            if tamanho == 0:
+                # Cabeçalhos finais (trailers), até a linha vazia
+                while self.rfile.readline(1024) not in (b'\r\n', b'\n', b''):
+                    pass
+                return
+            yield from self._corpo_tamanho(tamanho)
+            self.rfile.readline(1024)
+
+    def _limitar(self, blocos):
+        recebidos = 0
+        for bloco in blocos:
+            recebidos += len(bloco)
+            if recebidos > self.server.limite_bytes:
+                raise ErroRequisicao(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'arquivo maior que o limite do servidor')
+            yield bloco
+
+    def _responder_json(self, status, dados, cabecalhos=None):
+        corpo = json.dumps(dados, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _responder_arquivo(self, caminho, tipo):
+        try:
+            arquivo = open(caminho, 'rb')
+        except OSError:
+            raise ErroRequisicao(HTTPStatus.GONE, 'relatório não está mais disponível') from None
+        with arquivo:
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', tipo)
+            self.send_header('Content-Length', str(os.fstat(arquivo.fileno()).st_size))
+            self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(caminho)}"')
+            self.end_headers()
+            shutil.copyfileobj(arquivo, self.wfile, TAMANHO_BLOCO)
+
+    def log_message(self, formato, *args):
+        logger.info("%s - %s", self.address_string(), formato % args)
+
+
+def criar_servidor(host='127.0.0.1', porta=8502, **opcoes):
+    """ServidorNFCe escutando em host:porta (porta 0 escolhe uma livre); opcoes vão para ServidorNFCe"""
+    return ServidorNFCe((host, porta), **opcoes)
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+# Situação normalizada de cada documento (coluna 'Situação' do DataFrame)
+AUTORIZADA = 'AUTORIZADA'
+CANCELADA = 'CANCELADA'
+INUTILIZADA = 'INUTILIZADA'
+DENEGADA = 'DENEGADA'
+SEM_PROTOCOLO = 'SEM_PROTOCOLO'
+
+SITUACOES = [AUTORIZADA, CANCELADA, INUTILIZADA, DENEGADA, SEM_PROTOCOLO]
+
+# Status dos registros que vêm de eventos de cancelamento (envEvento e
+# procEventoNFe), e não da própria nota
+STATUS_EVENTO_CANCELAMENTO = 'CANCELADO'
+
+# Status da nota depois de juntada ao seu evento de cancelamento (xMotivo do cStat 101)
+STATUS_NOTA_CANCELADA = 'Cancelamento de NF-e homologado'
+
+# Prioridade de cada situação ao juntar registros da mesma chave: a situação
+# de maior prioridade prevalece (uma nota cancelada não volta a autorizada)
+PRIORIDADE_SITUACAO = {
+    SEM_PROTOCOLO: 0,
+    AUTORIZADA: 1,
+    DENEGADA: 2,
+    CANCELADA: 3,
+    INUTILIZADA: 3,
+}
+
+# cStat da SEFAZ -> situação
+_SITUACAO_POR_CSTAT = {
+    '100': AUTORIZADA,
+    '150': AUTORIZADA,
+    '101': CANCELADA,
+    '151': CANCELADA,
+    '155': CANCELADA,
+    '102': INUTILIZADA,
+    '110': DENEGADA,
+    '205': DENEGADA,
+    '301': DENEGADA,
+    '302': DENEGADA,
+    '303': DENEGADA,
+}
+
+
+def situacao_por_cstat(cstat, padrao=SEM_PROTOCOLO):
+    """Situação correspondente ao cStat do protocolo; padrao quando não há cStat conhecido"""
+    return _SITUACAO_POR_CSTAT.get(str(cstat or '').strip(), padrao)
+
+
+def situacao_por_status(status):
+    """
+    Deduz a situação pelo texto da coluna Status, para DataFrames montados
+    sem a coluna 'Situação' (mesmo critério usado antes da classificação por cStat)
+    """
+    texto = pd.Series(status).astype(str).str.upper()
+    cancelada = texto.str.contains('CANCELADO', na=False)
+    inutilizada = texto.str.contains('INUTILIZADO', na=False) & ~cancelada
+    valores = np.select([cancelada, inutilizada], [CANCELADA, INUTILIZADA], AUTORIZADA)
+    return pd.Categorical(valores, categories=SITUACOES)
+
+
+def como_categoria(situacoes):
+    """Converte a coluna 'Situação' em Categorical com as categorias de SITUACOES"""
+    return pd.Categorical(situacoes, categories=SITUACOES)
+
+
+def situacoes(df):
+    """Coluna 'Situação' de df (deduzida do Status se ainda não existir)"""
+    if 'Situação' in df.columns:
+        return df['Situação']
+    return pd.Series(situacao_por_status(df['Status']), index=df.index)
+
+
+def mascaras(df):
+    """
+    Máscaras booleanas (normais, inutilizadas, canceladas) das linhas de df.
+    Normais são todas as que não foram canceladas nem inutilizadas.
+    """
+    coluna = situacoes(df)
+    canceladas = (coluna == CANCELADA).to_numpy(dtype=bool)
+    inutilizadas = (coluna == INUTILIZADA).to_numpy(dtype=bool)
+    return ~(canceladas | inutilizadas), inutilizadas, canceladas
+
+
+def prioridades(df):
+    """Prioridade (PRIORIDADE_SITUACAO) da situação de cada linha de df, como array int64"""
+    valores = pd.Series(situacoes(df), copy=False).astype(object).map(PRIORIDADE_SITUACAO)
+    return valores.fillna(0).to_numpy(dtype=np.int64)
+
+
+def eventos_cancelamento(df):
+    """Máscara booleana das linhas de df que são eventos de cancelamento (e não a nota cancelada)"""
+    status = (df['Status'].astype(str) == STATUS_EVENTO_CANCELAMENTO).to_numpy(dtype=bool)
+    return status & (situacoes(df) == CANCELADA).to_numpy(dtype=bool)
@@ -0,0 +1,198 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+# Situações de uma tarefa
+NA_FILA = 'na_fila'
+EXECUTANDO = 'executando'
+CONCLUIDA = 'concluida'
+FALHOU = 'falhou'
+
+
+class Tarefa:
+    """
+    Um processamento enviado à FilaTarefas: a função, o progresso informado
+    por ela e, ao terminar, o resultado ou a mensagem de erro
+    """
+
+    def __init__(self, funcao, args, kwargs, dono):
+        self.id = uuid.uuid4().hex
+        self.dono = dono
+        self.funcao = funcao
+        self.args = args
+        self.kwargs = kwargs
+        self.situacao = NA_FILA
+        self.processados = 0
+        self.total = None
+        self.resultado = None
+        self.erro = None
+        self.criada = time.time()
+        self.iniciada = None
+        self.terminada_em = None
+
+    @property
+    def terminada(self):
+        return self.situacao in (CONCLUIDA, FALHOU)
+
+    def progresso(self, processados, total):
+        """Chamado pela função da tarefa, como o progresso de pipeline.processar_xmls"""
+        self.processados, self.total = processados, total
+
+    def fracao(self):
+        """Parte já processada (0 a 1), ou None se o total não é conhecido"""
+        if self.situacao == CONCLUIDA:
+            return 1.0
+        if not self.total:
+            return None
+        return min(self.processados / self.total, 1.0)
+
+    def _executar(self, trava):
+        self.iniciada = time.time()
+        resultado = erro = None
+        try:
+            resultado = self.funcao(*self.args, progresso=self.progresso, **self.kwargs)
+            situacao = CONCLUIDA
+        except Exception as e:
+            logger.exception("Falha na tarefa %s", self.id)
+            erro = str(e) or type(e).__name__
+            situacao = FALHOU
+        # Sob a trava da fila e com terminada_em antes da situação: quem vê a
+        # tarefa terminada vê também o resultado e o horário do fim
+        with trava:
+            # A função e os arquivos não são mais necessários
+            self.funcao = self.args = self.kwargs = None
+            self.resultado, self.erro = resultado, erro
+            self.terminada_em = time.time()
+            self.situacao = situacao
+
+
+class FilaTarefas:
+    """
+    Fila de processamentos executados em threads de fundo, fora da execução
+    do script que os enviou. Cada tarefa recebe um id para acompanhar o
+    progresso e buscar o resultado, que fica guardado até ser buscado (ou
+    até validade segundos depois de terminar).
+    Com vários donos (as sessões da interface), as threads atendem um dono
+    de cada vez, em rodízio: quem envia muitos arquivos não atrasa os outros.
+    """
+
+    def __init__(self, workers=1, validade=3600):
+        self.workers = max(workers, 1)
+        self.validade = validade
+        self._condicao = threading.Condition()
+        # Tarefas na fila de cada dono, na ordem do rodízio
+        self._filas = OrderedDict()
+        self._tarefas = {}
+        self._threads = []
+        self._fechada = False
+
+    def enviar(self, funcao, *args, dono=None, **kwargs):
+        """
+        Põe na fila a chamada funcao(*args, progresso=..., **kwargs) e
+        retorna o id da tarefa. progresso é Tarefa.progresso.
+        """
+        tarefa = Tarefa(funcao, args, kwargs, dono)
+        with self._condicao:
+            if self._fechada:
+                raise RuntimeError("Fila de tarefas encerrada")
+            self._expirar()
+            self._tarefas[tarefa.id] = tarefa
+            self._filas.setdefault(dono, deque()).append(tarefa)
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._trabalhar, name=f'nfce-tarefa-{len(self._threads)}',
+                                          daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._condicao.notify()
+        return tarefa.id
+
+    def tarefa(self, id_tarefa):
+        """A Tarefa do id (para consultar situação e progresso), ou None se não existe mais"""
+        with self._condicao:
+            return self._tarefas.get(id_tarefa)
+
+    def posicao(self, id_tarefa):
+        """Quantas tarefas serão iniciadas antes desta (0 se é a próxima), ou None se não está na fila"""
+        with self._condicao:
+            tarefa = self._tarefas.get(id_tarefa)
+            if tarefa is None or tarefa.situacao != NA_FILA:
+                return None
+            filas = [list(fila) for fila in self._filas.values()]
+            posicao = 0
+            # Simula o rodízio até chegar à tarefa
+            for rodada in range(max(map(len, filas))):
+                for fila in filas:
+                    if rodada < len(fila):
+                        if fila[rodada] is tarefa:
+                            return posicao
+                        posicao += 1
+            return None
+
+    def buscar(self, id_tarefa):
+        """
+        Retira da fila a tarefa terminada e a retorna (com resultado ou erro).
+        Retorna None se ela ainda não terminou ou não existe.
+        """
+        with self._condicao:
+            tarefa = self._tarefas.get(id_tarefa)
+            if tarefa is None or not tarefa.terminada:
+                return None
+            del self._tarefas[id_tarefa]
+            return tarefa
+
+    def cancelar(self, id_tarefa):
+        """Retira uma tarefa que ainda não começou; retorna se ela foi retirada"""
+        with self._condicao:
+            tarefa = self._tarefas.get(id_tarefa)
+            if tarefa is None or tarefa.situacao != NA_FILA:
+                return False
+            fila = self._filas[tarefa.dono]
+            fila.remove(tarefa)
+            if not fila:
+                del self._filas[tarefa.dono]
+            del self._tarefas[id_tarefa]
+            return True
+
+    def __len__(self):
+        with self._condicao:
+            return sum(len(fila) for fila in self._filas.values())
+
+    def _proxima(self):
+        # Primeira tarefa do próximo dono; ele vai para o fim do rodízio
+        dono, fila = self._filas.popitem(last=False)
+        tarefa = fila.popleft()
+        if fila:
+            self._filas[dono] = fila
+        return tarefa
+
+    def _expirar(self):
+        # Resultados que ninguém buscou não ficam na memória para sempre
+        limite = time.time() - self.validade
+        for id_tarefa in [id_tarefa for id_tarefa, tarefa in self._tarefas.items()
+                          if tarefa.terminada and tarefa.terminada_em < limite]:
+            del self._tarefas[id_tarefa]
+
+    def _trabalhar(self):
+        while True:
+            with self._condicao:
+                while not self._filas and not self._fechada:
+                    self._condicao.wait()
+                if self._fechada:
+                    return
+                tarefa = self._proxima()
+                # Ainda sob a trava: a tarefa não pode mais ser cancelada
+                tarefa.situacao = EXECUTANDO
+            tarefa._executar(self._condicao)
+
+    def fechar(self, esperar=True):
+        """Encerra as threads; as tarefas que estão na fila não são mais iniciadas"""
+        with self._condicao:
+            self._fechada = True
+            self._condicao.notify_all()
+        if esperar:
+            for thread in self._threads:
+                thread.join()